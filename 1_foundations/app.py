@@ -3,21 +3,42 @@ from openai import OpenAI
 import json
 import os
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pypdf import PdfReader
 import gradio as gr
 
 
 load_dotenv(override=True)
 
+# One pooled session, used from a background thread so a slow push never delays the chat. Only
+# connection errors and 429s are retried: Pushover can't have received those, so no duplicates
+push_session = requests.Session()
+push_retries = Retry(
+    total=3, connect=3, read=0, status=3, status_forcelist=[429], allowed_methods=["POST"], backoff_factor=1
+)
+push_session.mount("https://", HTTPAdapter(max_retries=push_retries))
+push_executor = ThreadPoolExecutor(max_workers=1)
+
+
+def send_push(text):
+    try:
+        push_session.post(
+            "https://api.pushover.net/1/messages.json",
+            data={
+                "token": os.getenv("PUSHOVER_TOKEN"),
+                "user": os.getenv("PUSHOVER_USER"),
+                "message": text,
+            },
+            timeout=10,
+        ).raise_for_status()
+    except requests.RequestException as e:
+        print(f"Push notification failed: {e}")
+
+
 def push(text):
-    requests.post(
-        "https://api.pushover.net/1/messages.json",
-        data={
-            "token": os.getenv("PUSHOVER_TOKEN"),
-            "user": os.getenv("PUSHOVER_USER"),
-            "message": text,
-        }
-    )
+    push_executor.submit(send_push, text)
 
 
 def record_user_details(email, name="Name not provided", notes="not provided"):
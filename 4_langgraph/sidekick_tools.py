@@ -2,7 +2,15 @@ from playwright.async_api import async_playwright
 from langchain_community.agent_toolkits import PlayWrightBrowserToolkit
 from dotenv import load_dotenv
 import os
+import json
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import datetime
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from langchain.agents import Tool
 from langchain_community.agent_toolkits import FileManagementToolkit
 from langchain_community.tools.wikipedia.tool import WikipediaQueryRun
@@ -18,6 +26,22 @@ pushover_user = os.getenv("PUSHOVER_USER")
 pushover_url = "https://api.pushover.net/1/messages.json"
 serper = GoogleSerperAPIWrapper()
 
+# Notifications go out from a background thread, so the tool call never waits for Pushover.
+# The thread waits NOTIFY_COALESCE_SECONDS after the first message of a burst and sends the burst
+# as one notification, with repeats collapsed. NOTIFY_SINK is "pushover" or "file" (JSON lines in
+# NOTIFY_FILE), as in 6_mcp's notifier. Sends are retried only when Pushover cannot have received
+# them (connection errors and 429s), so a retry never delivers a notification twice.
+NOTIFY_SINK = os.getenv("NOTIFY_SINK", "pushover" if pushover_user and pushover_token else "file")
+NOTIFY_FILE = os.getenv("NOTIFY_FILE", "notifications.jsonl")
+NOTIFY_COALESCE_SECONDS = float(os.getenv("NOTIFY_COALESCE_SECONDS", "2"))
+
+push_session = requests.Session()
+push_retries = Retry(
+    total=3, connect=3, read=0, status=3, status_forcelist=[429], allowed_methods=["POST"], backoff_factor=1
+)
+push_session.mount("https://", HTTPAdapter(max_retries=push_retries))
+push_queue = queue.Queue()
+
 async def playwright_tools():
     playwright = await async_playwright().start()
     browser = await playwright.chromium.launch(headless=False)
@@ -25,9 +49,33 @@ async def playwright_tools():
     return toolkit.get_tools(), browser, playwright
 
 
+def send_push(text: str):
+    try:
+        if NOTIFY_SINK == "file":
+            with open(NOTIFY_FILE, "a") as f:
+                f.write(json.dumps({"datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "message": text}) + "\n")
+        else:
+            push_session.post(pushover_url, data = {"token": pushover_token, "user": pushover_user, "message": text}, timeout=10).raise_for_status()
+    except (OSError, requests.RequestException) as e:
+        print(f"Push notification failed: {e}")
+
+
+def push_worker():
+    while True:
+        messages = [push_queue.get()]
+        time.sleep(NOTIFY_COALESCE_SECONDS)
+        while not push_queue.empty():
+            messages.append(push_queue.get_nowait())
+        counts = Counter(messages)
+        send_push("\n".join(m if counts[m] == 1 else f"{m} (x{counts[m]})" for m in counts))
+
+
+threading.Thread(target=push_worker, name="push", daemon=True).start()
+
+
 def push(text: str):
     """Send a push notification to the user"""
-    requests.post(pushover_url, data = {"token": pushover_token, "user": pushover_user, "message": text})
+    push_queue.put(text)
     return "success"
 
 
@@ -1,15 +1,42 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr
+from typing import Literal
 import json
+import os
 from dotenv import load_dotenv
-from datetime import datetime
-from market import get_share_price
-from database import write_account, read_account, write_log
+from market import get_share_price, get_share_prices, market_time
+from database import (
+    write_account,
+    read_account,
+    write_log,
+    write_trades,
+    read_transactions,
+    read_transactions_page,
+    count_transactions,
+    latest_transaction_id,
+    transaction_stats,
+    write_portfolio_value,
+    read_portfolio_values,
+    clear_account_history,
+)
 
 load_dotenv(override=True)
 
 INITIAL_BALANCE = 10_000.0
 SPREAD = 0.002
 
+# How many of the latest transactions are included in an account report; older ones are paged through
+REPORT_TRANSACTIONS = 20
+
+# The account digest given to the traders' prompts: this many recent trades, with rationales cut to this length
+DIGEST_TRADES = 5
+DIGEST_RATIONALE_CHARS = 120
+
+# The ledger-derived part of each account's digest, as (latest transaction id, data), reused until the next trade
+_digest_cache: dict[str, tuple[int, dict]] = {}
+
+# How sales are matched against purchases for cost basis and realized P&L: "average" or "fifo"
+COST_BASIS_METHOD = os.getenv("COST_BASIS_METHOD", "average").strip().lower()
+
 
 class Transaction(BaseModel):
     symbol: str
@@ -25,39 +52,141 @@ class Transaction(BaseModel):
         return f"{abs(self.quantity)} shares of {self.symbol} at {self.price} each."
 
 
+class Order(BaseModel):
+    # Forbidding extra keys gives the tool schema additionalProperties: false, as strict tool schemas require
+    model_config = ConfigDict(extra="forbid")
+
+    action: Literal["buy", "sell"] = Field(description="Whether to buy or sell")
+    symbol: str = Field(description="The symbol of the stock")
+    quantity: int = Field(description="The number of shares, always positive")
+    rationale: str = Field(description="The rationale for the order and fit with the account's strategy")
+
+
 class Account(BaseModel):
     name: str
     balance: float
     strategy: str
     holdings: dict[str, int]
-    transactions: list[Transaction]
-    portfolio_value_time_series: list[tuple[str, float]]
+    # Running aggregates, updated on every trade so P&L never needs a pass over the ledger:
+    # the net cash spent on shares, the P&L realized by sales, and the open lots per symbol
+    # as (quantity, price) pairs - a single merged lot under average cost
+    net_invested: float = 0.0
+    realized_pnl: float = 0.0
+    lots: dict[str, list[tuple[int, float]]] = {}
+    # The ledger and the portfolio value history live in their own append-only tables;
+    # they are only read from the database when first accessed
+    _transactions: list[Transaction] | None = PrivateAttr(default=None)
+    _portfolio_value_time_series: list[tuple[str, float]] | None = PrivateAttr(default=None)
 
     @classmethod
     def get(cls, name: str):
         fields = read_account(name.lower())
         if not fields:
-            fields = {
-                "name": name.lower(),
-                "balance": INITIAL_BALANCE,
-                "strategy": "",
-                "holdings": {},
-                "transactions": [],
-                "portfolio_value_time_series": []
-            }
-            write_account(name, fields)
-        return cls(**fields)
-    
-    
+            account = cls(name=name.lower(), balance=INITIAL_BALANCE, strategy="", holdings={})
+            account.save()
+            return account
+        account = cls(**{key: value for key, value in fields.items() if value is not None})
+        if fields["lots"] is None:
+            # Stored before the aggregates existed
+            account.rebuild_aggregates()
+        return account
+
+    @property
+    def transactions(self) -> list[Transaction]:
+        if self._transactions is None:
+            self._transactions = [Transaction(**row) for row in read_transactions(self.name)]
+        return self._transactions
+
+    @property
+    def portfolio_value_time_series(self) -> list[tuple[str, float]]:
+        if self._portfolio_value_time_series is None:
+            self._portfolio_value_time_series = read_portfolio_values(self.name)
+        return self._portfolio_value_time_series
+
     def save(self):
         write_account(self.name.lower(), self.model_dump())
 
+    def record_transaction(self, transaction: Transaction):
+        """ Append a transaction to the ledger and save the account state in one database transaction. """
+        self.record_transactions([transaction])
+
+    def record_transactions(self, transactions: list[Transaction]):
+        """ Append several transactions to the ledger and save the account state in one database transaction. """
+        for transaction in transactions:
+            self.update_aggregates(transaction)
+        write_trades(self.name, self.model_dump(), [transaction.model_dump() for transaction in transactions])
+        if self._transactions is not None:
+            self._transactions.extend(transactions)
+
+    def update_aggregates(self, transaction: Transaction):
+        """ Fold one transaction into the running cost basis and P&L aggregates. """
+        self.net_invested += transaction.total()
+        lots = self.lots.setdefault(transaction.symbol, [])
+        if transaction.quantity > 0:
+            if COST_BASIS_METHOD == "average" and lots:
+                quantity, price = lots[0]
+                total_quantity = quantity + transaction.quantity
+                lots[0] = (total_quantity, (quantity * price + transaction.total()) / total_quantity)
+            else:
+                lots.append((transaction.quantity, transaction.price))
+        else:
+            remaining = -transaction.quantity
+            while remaining and lots:
+                quantity, price = lots[0]
+                matched = min(quantity, remaining)
+                self.realized_pnl += (transaction.price - price) * matched
+                remaining -= matched
+                if matched == quantity:
+                    lots.pop(0)
+                else:
+                    lots[0] = (quantity - matched, price)
+        if not lots:
+            del self.lots[transaction.symbol]
+
+    def replay_aggregates(self) -> "Account":
+        """ Recompute holdings and aggregates from the full ledger, returned as a fresh Account. """
+        replayed = Account(name=self.name, balance=self.balance, strategy=self.strategy, holdings={})
+        for transaction in self.transactions:
+            replayed.holdings[transaction.symbol] = replayed.holdings.get(transaction.symbol, 0) + transaction.quantity
+            replayed.update_aggregates(transaction)
+        replayed.holdings = {symbol: quantity for symbol, quantity in replayed.holdings.items() if quantity}
+        return replayed
+
+    def rebuild_aggregates(self):
+        """ Replace the aggregates with ones recomputed from the ledger, and save them. """
+        replayed = self.replay_aggregates()
+        self.net_invested = replayed.net_invested
+        self.realized_pnl = replayed.realized_pnl
+        self.lots = replayed.lots
+        self.save()
+
+    def check_consistency(self, tolerance: float = 1e-6) -> list[str]:
+        """ Compare the stored holdings and aggregates with the full ledger; returns any discrepancies. """
+        replayed = self.replay_aggregates()
+        problems = []
+        if replayed.holdings != self.holdings:
+            problems.append(f"holdings {self.holdings} != ledger {replayed.holdings}")
+        for field in ("net_invested", "realized_pnl"):
+            stored, expected = getattr(self, field), getattr(replayed, field)
+            if abs(stored - expected) > tolerance:
+                problems.append(f"{field} {stored} != ledger {expected}")
+        if replayed.lots.keys() != self.lots.keys() or any(
+            abs(cost - replayed.cost_basis()[symbol]) > tolerance
+            for symbol, cost in self.cost_basis().items()
+        ):
+            problems.append(f"cost basis {self.cost_basis()} != ledger {replayed.cost_basis()}")
+        return problems
+
     def reset(self, strategy: str):
         self.balance = INITIAL_BALANCE
         self.strategy = strategy
         self.holdings = {}
-        self.transactions = []
-        self.portfolio_value_time_series = []
+        self.net_invested = 0.0
+        self.realized_pnl = 0.0
+        self.lots = {}
+        self._transactions = []
+        self._portfolio_value_time_series = []
+        clear_account_history(self.name)
         self.save()
 
     def deposit(self, amount: float):
@@ -89,14 +218,12 @@ class Account(BaseModel):
         
         # Update holdings
         self.holdings[symbol] = self.holdings.get(symbol, 0) + quantity
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        # Record transaction
+        timestamp = market_time().strftime("%Y-%m-%d %H:%M:%S")
         transaction = Transaction(symbol=symbol, quantity=quantity, price=buy_price, timestamp=timestamp, rationale=rationale)
-        self.transactions.append(transaction)
-        
-        # Update balance
+
+        # Update balance and record transaction
         self.balance -= total_cost
-        self.save()
+        self.record_transaction(transaction)
         write_log(self.name, "account", f"Bought {quantity} of {symbol}")
         return "Completed. Latest details:\n" + self.report()
 
@@ -115,28 +242,70 @@ class Account(BaseModel):
         # If shares are completely sold, remove from holdings
         if self.holdings[symbol] == 0:
             del self.holdings[symbol]
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        # Record transaction
+        timestamp = market_time().strftime("%Y-%m-%d %H:%M:%S")
         transaction = Transaction(symbol=symbol, quantity=-quantity, price=sell_price, timestamp=timestamp, rationale=rationale)  # negative quantity for sell
-        self.transactions.append(transaction)
 
-        # Update balance
+        # Update balance and record transaction
         self.balance += total_proceeds
-        self.save()
+        self.record_transaction(transaction)
         write_log(self.name, "account", f"Sold {quantity} of {symbol}")
         return "Completed. Latest details:\n" + self.report()
 
+    def execute_orders(self, orders: list[Order]) -> str:
+        """
+        Execute a batch of orders all-or-nothing. Prices are fetched in one lookup, sells are
+        applied before buys so their proceeds can fund the purchases, and the batch is
+        validated as a whole before any of it is recorded in a single database transaction.
+        """
+        if not orders:
+            raise ValueError("No orders given.")
+        prices = get_share_prices(order.symbol for order in orders)
+        holdings = dict(self.holdings)
+        balance = self.balance
+        timestamp = market_time().strftime("%Y-%m-%d %H:%M:%S")
+        transactions, problems = [], []
+        for order in sorted(orders, key=lambda order: order.action != "sell"):
+            price = prices[order.symbol]
+            if order.quantity <= 0:
+                problems.append(f"Quantity for {order.symbol} must be positive.")
+            elif price == 0:
+                problems.append(f"Unrecognized symbol {order.symbol}")
+            elif order.action == "sell" and holdings.get(order.symbol, 0) < order.quantity:
+                problems.append(f"Cannot sell {order.quantity} shares of {order.symbol}. Not enough shares held.")
+            else:
+                trade_price = price * (1 + SPREAD) if order.action == "buy" else price * (1 - SPREAD)
+                quantity = order.quantity if order.action == "buy" else -order.quantity
+                holdings[order.symbol] = holdings.get(order.symbol, 0) + quantity
+                balance -= trade_price * quantity
+                transactions.append(Transaction(symbol=order.symbol, quantity=quantity, price=trade_price, timestamp=timestamp, rationale=order.rationale))
+        if balance < 0 and not problems:
+            problems.append(f"Insufficient funds: the orders would leave a balance of {balance:.2f}.")
+        if problems:
+            raise ValueError("No orders were executed. " + " ".join(problems))
+
+        self.holdings = {symbol: quantity for symbol, quantity in holdings.items() if quantity}
+        self.balance = balance
+        self.record_transactions(transactions)
+        summary = ", ".join(f"{'Bought' if t.quantity > 0 else 'Sold'} {abs(t.quantity)} of {t.symbol}" for t in transactions)
+        write_log(self.name, "account", f"Executed orders: {summary}")
+        return "Completed. Latest details:\n" + self.report()
+
     def calculate_portfolio_value(self):
         """ Calculate the total value of the user's portfolio. """
-        total_value = self.balance
-        for symbol, quantity in self.holdings.items():
-            total_value += get_share_price(symbol) * quantity
-        return total_value
+        prices = get_share_prices(self.holdings)
+        return self.balance + sum(prices[symbol] * quantity for symbol, quantity in self.holdings.items())
 
     def calculate_profit_loss(self, portfolio_value: float):
         """ Calculate profit or loss from the initial spend. """
-        initial_spend = sum(transaction.total() for transaction in self.transactions)
-        return portfolio_value - initial_spend - self.balance
+        return portfolio_value - self.net_invested - self.balance
+
+    def cost_basis(self) -> dict[str, float]:
+        """ The total cost of the shares still held, per symbol. """
+        return {symbol: sum(quantity * price for quantity, price in lots) for symbol, lots in self.lots.items()}
+
+    def calculate_unrealized_profit_loss(self, portfolio_value: float):
+        """ Calculate the profit or loss on open positions relative to their cost basis. """
+        return portfolio_value - self.balance - sum(self.cost_basis().values())
 
     def get_holdings(self):
         """ Report the current holdings of the user. """
@@ -149,19 +318,88 @@ class Account(BaseModel):
     def list_transactions(self):
         """ List all transactions made by the user. """
         return [transaction.model_dump() for transaction in self.transactions]
+
+    def recent_transactions(self, n: int) -> list[dict]:
+        """ The most recent n transactions, oldest first, without loading the whole ledger. """
+        if self._transactions is not None:
+            return [transaction.model_dump() for transaction in self._transactions[-n:]] if n > 0 else []
+        rows = read_transactions_page(self.name, limit=n)
+        return [{key: value for key, value in row.items() if key != "id"} for row in reversed(rows)]
+
+    def transactions_page(self, cursor: int | None = None, limit: int = 50) -> dict:
+        """ A page of transactions, newest first, with the cursor for the next (older) page or None at the end. """
+        rows = read_transactions_page(self.name, before=cursor, limit=limit)
+        next_cursor = rows[-1]["id"] if len(rows) == limit else None
+        return {"transactions": rows, "next_cursor": next_cursor}
     
+    def record_portfolio_value(self, portfolio_value: float):
+        """ Add a point to the portfolio value history. """
+        timestamp = market_time().strftime("%Y-%m-%d %H:%M:%S")
+        write_portfolio_value(self.name, timestamp, portfolio_value)
+        if self._portfolio_value_time_series is not None:
+            self._portfolio_value_time_series.append((timestamp, portfolio_value))
+
     def report(self) -> str:
         """ Return a json string representing the account.  """
         portfolio_value = self.calculate_portfolio_value()
-        self.portfolio_value_time_series.append((datetime.now().strftime("%Y-%m-%d %H:%M:%S"), portfolio_value))
-        self.save()
+        self.record_portfolio_value(portfolio_value)
         pnl = self.calculate_profit_loss(portfolio_value)
-        data = self.model_dump()
+        data = self.model_dump(exclude={"lots"})
+        data["cost_basis"] = self.cost_basis()
+        data["transactions"] = self.recent_transactions(REPORT_TRANSACTIONS)
+        data["transaction_count"] = count_transactions(self.name)
         data["total_portfolio_value"] = portfolio_value
         data["total_profit_loss"] = pnl
+        data["unrealized_profit_loss"] = self.calculate_unrealized_profit_loss(portfolio_value)
         write_log(self.name, "account", f"Retrieved account details")
         return json.dumps(data)
     
+    def ledger_digest(self) -> dict:
+        """ The last few trades and whole-ledger statistics, cached until the account records a new trade. """
+        version = latest_transaction_id(self.name)
+        cached = _digest_cache.get(self.name)
+        if cached is None or cached[0] != version:
+            recent = [
+                {**transaction, "rationale": (transaction["rationale"] or "")[:DIGEST_RATIONALE_CHARS]}
+                for transaction in self.recent_transactions(DIGEST_TRADES)
+            ]
+            stats = transaction_stats(self.name)
+            stats["bought_value"] = round(stats["bought_value"], 2)
+            stats["sold_value"] = round(stats["sold_value"], 2)
+            cached = (version, {"recent_transactions": recent, "trading_stats": stats})
+            _digest_cache[self.name] = cached
+        return cached[1]
+
+    def digest(self) -> str:
+        """ Return a compact json summary of the account whose size doesn't grow with its history. """
+        prices = get_share_prices(self.holdings)
+        portfolio_value = self.balance + sum(prices[symbol] * quantity for symbol, quantity in self.holdings.items())
+        self.record_portfolio_value(portfolio_value)
+        cost_basis = self.cost_basis()
+        positions = {}
+        for symbol, quantity in self.holdings.items():
+            cost = cost_basis.get(symbol, 0.0)
+            value = prices[symbol] * quantity
+            positions[symbol] = {
+                "quantity": quantity,
+                "average_cost": round(cost / quantity, 2) if quantity else 0.0,
+                "price": round(prices[symbol], 2),
+                "value": round(value, 2),
+                "unrealized_profit_loss": round(value - cost, 2),
+            }
+        data = {
+            "name": self.name,
+            "balance": round(self.balance, 2),
+            "total_portfolio_value": round(portfolio_value, 2),
+            "total_profit_loss": round(self.calculate_profit_loss(portfolio_value), 2),
+            "realized_profit_loss": round(self.realized_pnl, 2),
+            "unrealized_profit_loss": round(self.calculate_unrealized_profit_loss(portfolio_value), 2),
+            "positions": positions,
+            **self.ledger_digest(),
+        }
+        write_log(self.name, "account", "Retrieved account digest")
+        return json.dumps(data, separators=(",", ":"))
+
     def get_strategy(self) -> str:
         """ Return the strategy of the account """
         write_log(self.name, "account", f"Retrieved strategy")
@@ -1,39 +1,40 @@
-import mcp
-from mcp.client.stdio import stdio_client
 from mcp import StdioServerParameters
 from agents import FunctionTool
+from session_pool import SessionPool
 import json
 
 params = StdioServerParameters(command="uv", args=["run", "accounts_server.py"], env=None)
 
+# Long-lived sessions to the accounts server, shared by every call below.
+# Hold a reference with `async with accounts_sessions:` to close them when done.
+accounts_sessions = SessionPool(params)
+
 
 async def list_accounts_tools():
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            tools_result = await session.list_tools()
-            return tools_result.tools
-        
+    tools_result = await accounts_sessions.call(lambda session: session.list_tools())
+    return tools_result.tools
+
 async def call_accounts_tool(tool_name, tool_args):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.call_tool(tool_name, tool_args)
-            return result
-            
+    return await accounts_sessions.call(lambda session: session.call_tool(tool_name, tool_args))
+
 async def read_accounts_resource(name):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.read_resource(f"accounts://accounts_server/{name}")
-            return result.contents[0].text
-        
+    result = await accounts_sessions.call(
+        lambda session: session.read_resource(f"accounts://accounts_server/{name}")
+    )
+    return result.contents[0].text
+
+async def read_digest_resource(name):
+    result = await accounts_sessions.call(lambda session: session.read_resource(f"accounts://digest/{name}"))
+    return result.contents[0].text
+
 async def read_strategy_resource(name):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.read_resource(f"accounts://strategy/{name}")
-            return result.contents[0].text
+    result = await accounts_sessions.call(lambda session: session.read_resource(f"accounts://strategy/{name}"))
+    return result.contents[0].text
+
+async def read_transactions_resource(name, cursor=None):
+    uri = f"accounts://transactions/{name}/{'latest' if cursor is None else cursor}"
+    result = await accounts_sessions.call(lambda session: session.read_resource(uri))
+    return json.loads(result.contents[0].text)
 
 async def get_accounts_tools_openai():
     openai_tools = []
@@ -1,9 +1,7 @@
+import json
 from mcp.server.fastmcp import FastMCP
-from accounts import Account
+from accounts import Account, Order
 
-mcp = FastMCP("accounts_server")
-
-@mcp.tool()
 async def get_balance(name: str) -> float:
     """Get the cash balance of the given account name.
 
@@ -12,7 +10,6 @@ async def get_balance(name: str) -> float:
     """
     return Account.get(name).balance
 
-@mcp.tool()
 async def get_holdings(name: str) -> dict[str, int]:
     """Get the holdings of the given account name.
 
@@ -21,7 +18,6 @@ async def get_holdings(name: str) -> dict[str, int]:
     """
     return Account.get(name).holdings
 
-@mcp.tool()
 async def buy_shares(name: str, symbol: str, quantity: int, rationale: str) -> float:
     """Buy shares of a stock.
 
@@ -34,7 +30,6 @@ async def buy_shares(name: str, symbol: str, quantity: int, rationale: str) -> f
     return Account.get(name).buy_shares(symbol, quantity, rationale)
 
 
-@mcp.tool()
 async def sell_shares(name: str, symbol: str, quantity: int, rationale: str) -> float:
     """Sell shares of a stock.
 
@@ -46,7 +41,28 @@ async def sell_shares(name: str, symbol: str, quantity: int, rationale: str) ->
     """
     return Account.get(name).sell_shares(symbol, quantity, rationale)
 
-@mcp.tool()
+async def execute_orders(name: str, orders: list[Order]) -> str:
+    """Execute several buy and sell orders at once, for example to rebalance a portfolio.
+    The orders succeed or fail together: sells are applied first, then buys, and nothing is
+    executed if any order is invalid or the account cannot afford the batch.
+
+    Args:
+        name: The name of the account holder
+        orders: The orders to execute, each with an action (buy or sell), symbol, quantity and rationale
+    """
+    return Account.get(name).execute_orders(orders)
+
+async def list_transactions(name: str, cursor: int | None = None, limit: int = 20) -> str:
+    """List the account's transactions, newest first, one page at a time.
+    The account report only includes the most recent transactions; use this to look further back.
+
+    Args:
+        name: The name of the account holder
+        cursor: The next_cursor from the previous page, or omit it for the most recent transactions
+        limit: The maximum number of transactions to return, up to 100
+    """
+    return json.dumps(Account.get(name).transactions_page(cursor, min(max(limit, 1), 100)))
+
 async def change_strategy(name: str, strategy: str) -> str:
     """At your discretion, if you choose to, call this to change your investment strategy for the future.
 
@@ -56,15 +72,35 @@ async def change_strategy(name: str, strategy: str) -> str:
     """
     return Account.get(name).change_strategy(strategy)
 
-@mcp.resource("accounts://accounts_server/{name}")
 async def read_account_resource(name: str) -> str:
     account = Account.get(name.lower())
     return account.report()
 
-@mcp.resource("accounts://strategy/{name}")
+async def read_digest_resource(name: str) -> str:
+    account = Account.get(name.lower())
+    return account.digest()
+
 async def read_strategy_resource(name: str) -> str:
     account = Account.get(name.lower())
     return account.get_strategy()
 
+async def read_transactions_resource(name: str, cursor: str) -> str:
+    """A page of transactions before the cursor; use 'latest' for the most recent page."""
+    account = Account.get(name.lower())
+    return json.dumps(account.transactions_page(None if cursor == "latest" else int(cursor)))
+
+def register(mcp: FastMCP) -> None:
+    """Add the accounts tools and resources to an MCP server; the trading server combines them with others."""
+    for tool in (get_balance, get_holdings, buy_shares, sell_shares, execute_orders, list_transactions, change_strategy):
+        mcp.tool()(tool)
+    mcp.resource("accounts://accounts_server/{name}")(read_account_resource)
+    mcp.resource("accounts://digest/{name}")(read_digest_resource)
+    mcp.resource("accounts://strategy/{name}")(read_strategy_resource)
+    mcp.resource("accounts://transactions/{name}/{cursor}")(read_transactions_resource)
+
+
+mcp = FastMCP("accounts_server")
+register(mcp)
+
 if __name__ == "__main__":
     mcp.run(transport='stdio')
\ No newline at end of file
@@ -1,10 +1,19 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from types import MappingProxyType
 import gradio as gr
 from util import css, js, Color
 import pandas as pd
 from trading_floor import names, lastnames, short_model_names
 import plotly.express as px
 from accounts import Account
-from database import read_log
+from portfolio_series import query_portfolio_series
+from datetime import datetime, timedelta, timezone
+from database import read_logs_after, read_recent_logs, latest_log_id, data_version, read_leaderboard
+from database import read_span_latencies, read_trader_costs, SPAN_GROUPS
 
 mapper = {
     "trace": Color.WHITE,
@@ -15,6 +24,90 @@ mapper = {
     "account": Color.RED,
 }
 
+LOG_LINES = 13
+
+# How often the shared snapshot service recomputes every trader, and how often sessions check it
+SNAPSHOT_INTERVAL = 60
+SESSION_REFRESH_INTERVAL = 15
+
+# The transactions table shows only the latest trades rather than the whole ledger
+TRANSACTIONS_SHOWN = 100
+
+COMPONENTS = ("portfolio_value", "chart", "holdings", "transactions")
+
+# The first traders get a column each; when there are more, every trader is ranked in a paginated leaderboard
+MAX_TRADER_COLUMNS = 4
+LEADERBOARD_PAGE_SIZE = 20
+LEADERBOARD_COLUMNS = ["Rank", "Trader", "Model", "Portfolio Value", "Profit/Loss", "Cash", "Updated"]
+
+# The latency panel summarizes the traders' spans over this window
+LATENCY_WINDOW_HOURS = 24
+LATENCY_COLUMNS = ["Spans", "p50 ms", "p95 ms", "p99 ms", "Errors", "Input Tokens", "Output Tokens"]
+
+COST_COLUMNS = ["Trader", "Model", "Runs", "Over Budget", "Tokens", "Model Cost", "Profit/Loss", "Profit/Loss per $"]
+
+
+def render_log(timestamp, type, message) -> str:
+    color = mapper.get(type, Color.WHITE).value
+    return f"<span style='color:{color}'>{timestamp} : [{type}] {message}</span><br/>"
+
+
+class LogTailer:
+    """
+    A single change feed over the logs table, shared by every browser session.
+
+    While anyone is subscribed, one task polls every interval seconds; it skips the query when
+    the database hasn't changed, otherwise reads only rows past its id cursor, renders each row
+    once, and pushes it to the queue of every session watching that trader.
+    With no subscribers the task stops, so idle dashboards cost nothing.
+    """
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.cursor = None
+        self.version = None
+        self.recent: dict[str, deque[str]] = {}
+        self.subscribers: dict[str, set[asyncio.Queue]] = {}
+        self.task = None
+
+    def subscribe(self, name: str) -> tuple[list[str], asyncio.Queue]:
+        """Returns the trader's most recent rendered lines and a queue of lines that arrive later."""
+        name = name.lower()
+        if self.cursor is None:
+            self.cursor = latest_log_id()
+        if name not in self.recent:
+            rows = read_recent_logs(name, LOG_LINES, self.cursor)
+            self.recent[name] = deque((render_log(*row[1:]) for row in rows), maxlen=LOG_LINES)
+        queue = asyncio.Queue()
+        self.subscribers.setdefault(name, set()).add(queue)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+        return list(self.recent[name]), queue
+
+    def unsubscribe(self, name: str, queue: asyncio.Queue) -> None:
+        self.subscribers.get(name.lower(), set()).discard(queue)
+
+    async def _run(self) -> None:
+        while any(self.subscribers.values()):
+            await asyncio.sleep(self.interval)
+            version = data_version()
+            if version == self.version:
+                continue
+            self.version = version
+            while rows := read_logs_after(self.cursor):
+                for id, name, timestamp, type, message in rows:
+                    self.cursor = id
+                    line = render_log(timestamp, type, message)
+                    self.recent.setdefault(name, deque(maxlen=LOG_LINES)).append(line)
+                    for queue in self.subscribers.get(name, ()):
+                        queue.put_nowait(line)
+        # Rebuilt from the database on the next subscribe, since rows may arrive while nobody is watching
+        self.cursor = None
+        self.recent.clear()
+
+
+log_tailer = LogTailer()
+
 
 class Trader:
     def __init__(self, name: str, lastname: str, model_name: str):
@@ -32,13 +125,15 @@ class Trader:
     def get_strategy(self) -> str:
         return self.account.get_strategy()
 
-    def get_portfolio_value_df(self) -> pd.DataFrame:
-        df = pd.DataFrame(self.account.portfolio_value_time_series, columns=["datetime", "value"])
+    def get_portfolio_value_df(self, series=None) -> pd.DataFrame:
+        if series is None:
+            series = query_portfolio_series(self.name)
+        df = pd.DataFrame(series, columns=["datetime", "value"])
         df["datetime"] = pd.to_datetime(df["datetime"])
         return df
 
-    def get_portfolio_value_chart(self):
-        df = self.get_portfolio_value_df()
+    def get_portfolio_value_chart(self, series=None):
+        df = self.get_portfolio_value_df(series)
         fig = px.line(df, x="datetime", y="value")
         margin = dict(l=40, r=20, t=20, b=40)
         fig.update_layout(
@@ -53,9 +148,10 @@ class Trader:
         fig.update_yaxes(tickfont=dict(size=8), tickformat=",.0f")
         return fig
 
-    def get_holdings_df(self) -> pd.DataFrame:
+    def get_holdings_df(self, holdings=None) -> pd.DataFrame:
         """Convert holdings to DataFrame for display"""
-        holdings = self.account.get_holdings()
+        if holdings is None:
+            holdings = self.account.get_holdings()
         if not holdings:
             return pd.DataFrame(columns=["Symbol", "Quantity"])
 
@@ -64,9 +160,10 @@ class Trader:
         )
         return df
 
-    def get_transactions_df(self) -> pd.DataFrame:
+    def get_transactions_df(self, transactions=None) -> pd.DataFrame:
         """Convert transactions to DataFrame for display"""
-        transactions = self.account.list_transactions()
+        if transactions is None:
+            transactions = self.account.recent_transactions(TRANSACTIONS_SHOWN)
         if not transactions:
             return pd.DataFrame(columns=["Timestamp", "Symbol", "Quantity", "Price", "Rationale"])
 
@@ -80,41 +177,213 @@ class Trader:
         emoji = "⬆" if pnl >= 0 else "⬇"
         return f"<div style='text-align: center;background-color:{color};'><span style='font-size:32px'>${portfolio_value:,.0f}</span><span style='font-size:24px'>&nbsp;&nbsp;&nbsp;{emoji}&nbsp;${pnl:,.0f}</span></div>"
 
-    def get_logs(self, previous=None) -> str:
-        logs = read_log(self.name, last_n=13)
-        response = ""
-        for log in logs:
-            timestamp, type, message = log
-            color = mapper.get(type, Color.WHITE).value
-            response += f"<span style='color:{color}'>{timestamp} : [{type}] {message}</span><br/>"
-        response = f"<div style='height:250px; overflow-y:auto;'>{response}</div>"
-        if response != previous:
-            return response
-        return gr.update()
+    def build_snapshot(self, previous: "TraderSnapshot | None") -> "TraderSnapshot":
+        """
+        Read the trader's current state once and render each component, reusing the previous
+        snapshot's rendering (and version) for components whose source data hasn't changed.
+        """
+        self.reload()
+        sources = {
+            "portfolio_value": self.get_portfolio_value(),
+            "chart": query_portfolio_series(self.name),
+            "holdings": dict(self.account.get_holdings()),
+            "transactions": self.account.recent_transactions(TRANSACTIONS_SHOWN),
+        }
+        renderers = {
+            "portfolio_value": lambda html: html,
+            "chart": self.get_portfolio_value_chart,
+            "holdings": self.get_holdings_df,
+            "transactions": self.get_transactions_df,
+        }
+        components = {}
+        for component, source in sources.items():
+            if previous and previous.sources[component] == source:
+                components[component] = previous.components[component]
+            else:
+                version = previous.components[component][0] + 1 if previous else 1
+                components[component] = (version, renderers[component](source))
+        return TraderSnapshot(
+            version=previous.version + 1 if previous else 1,
+            sources=MappingProxyType(sources),
+            components=MappingProxyType(components),
+        )
+
+    def placeholder_snapshot(self) -> "TraderSnapshot":
+        """An empty snapshot, at version 0, to show until the first real one has been built."""
+        sources = {"portfolio_value": None, "chart": [], "holdings": {}, "transactions": []}
+        components = {
+            "portfolio_value": (0, "<div style='text-align: center;'>Loading...</div>"),
+            "chart": (0, self.get_portfolio_value_chart([])),
+            "holdings": (0, self.get_holdings_df({})),
+            "transactions": (0, self.get_transactions_df([])),
+        }
+        return TraderSnapshot(version=0, sources=MappingProxyType(sources), components=MappingProxyType(components))
+
+    async def stream_logs(self):
+        """Yield the log panel's HTML now and again whenever new log lines arrive for this trader."""
+        initial, queue = log_tailer.subscribe(self.name)
+        lines = deque(initial, maxlen=LOG_LINES)
+        try:
+            while True:
+                yield f"<div style='height:250px; overflow-y:auto;'>{''.join(lines)}</div>"
+                lines.append(await queue.get())
+                while not queue.empty():
+                    lines.append(queue.get_nowait())
+        finally:
+            log_tailer.unsubscribe(self.name, queue)
+
+
+@dataclass(frozen=True)
+class TraderSnapshot:
+    """An immutable rendering of one trader, shared by every session; treat its contents as read-only."""
+
+    version: int
+    sources: MappingProxyType
+    components: MappingProxyType  # component name -> (version, rendered value)
+
+    def value(self, component: str):
+        return self.components[component][1]
+
+
+class SnapshotService:
+    """
+    Computes every trader's dashboard components once per interval on a background thread and
+    publishes them as immutable snapshots, so the cost of a refresh doesn't grow with the number
+    of open browser sessions.
+    """
+
+    def __init__(
+        self, traders: list[Trader], interval: float = SNAPSHOT_INTERVAL, models: dict[str, str] | None = None
+    ):
+        self.traders = traders
+        self.interval = interval
+        self.models = models
+        self.snapshots: dict[str, TraderSnapshot] = {}
+        # (version, rows) for every trader, ranked; only maintained when models are given
+        self.leaderboard: tuple[int, tuple] = (0, ())
+        # (version, {grouping: rows}) of span latencies across every trader
+        self.latencies: tuple[int, dict] = (0, {})
+        # (version, rows) of every trader's model costs and profit or loss, costliest first
+        self.costs: tuple[int, tuple] = (0, ())
+        self._placeholders: dict[str, TraderSnapshot] = {}
+        self._thread = None
+
+    def start(self) -> None:
+        self.refresh_all()
+        self._thread = threading.Thread(target=self._run, name="snapshot-service", daemon=True)
+        self._thread.start()
+
+    def refresh_all(self) -> None:
+        for trader in self.traders:
+            try:
+                self.snapshots[trader.name] = trader.build_snapshot(self.snapshots.get(trader.name))
+            except Exception as e:
+                print(f"Could not refresh the dashboard snapshot for {trader.name}: {e}")
+        if self.models is not None:
+            self.refresh_leaderboard()
+        try:
+            self.refresh_latencies()
+            self.refresh_costs()
+        except Exception as e:
+            print(f"Could not refresh the span latencies and model costs: {e}")
+
+    def refresh_leaderboard(self) -> None:
+        rows = tuple(
+            (
+                rank,
+                row["name"].title(),
+                self.models.get(row["name"], ""),
+                f"${row['value']:,.0f}",
+                f"${row['profit_loss']:,.0f}",
+                f"${row['balance']:,.0f}",
+                row["updated"],
+            )
+            for rank, row in enumerate(
+                (row for row in read_leaderboard() if row["name"] in self.models), start=1
+            )
+        )
+        version, previous = self.leaderboard
+        if rows != previous:
+            self.leaderboard = (version + 1, rows)
+
+    def refresh_latencies(self) -> None:
+        since = (datetime.now(timezone.utc) - timedelta(hours=LATENCY_WINDOW_HOURS)).strftime("%Y-%m-%d %H:%M:%S")
+        latencies = {
+            group: tuple(
+                (
+                    row[group],
+                    row["count"],
+                    round(row["p50_ms"]),
+                    round(row["p95_ms"]),
+                    round(row["p99_ms"]),
+                    row["errors"],
+                    row["input_tokens"],
+                    row["output_tokens"],
+                )
+                for row in read_span_latencies(group, since=since)
+            )
+            for group in SPAN_GROUPS
+        }
+        version, previous = self.latencies
+        if latencies != previous:
+            self.latencies = (version + 1, latencies)
+
+    def refresh_costs(self) -> None:
+        profit_loss = {row["name"]: row["profit_loss"] for row in read_leaderboard()}
+        rows = tuple(
+            (
+                row["name"].title(),
+                row["model"],
+                row["runs"],
+                row["over_budget"],
+                row["input_tokens"] + row["output_tokens"],
+                f"${row['cost']:,.2f}",
+                f"${profit_loss[row['name']]:,.0f}" if row["name"] in profit_loss else "",
+                f"${profit_loss[row['name']] / row['cost']:,.0f}" if row["name"] in profit_loss and row["cost"] else "",
+            )
+            for row in sorted(read_trader_costs(), key=lambda row: row["cost"], reverse=True)
+        )
+        version, previous = self.costs
+        if rows != previous:
+            self.costs = (version + 1, rows)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.refresh_all()
+
+    def get(self, name: str) -> TraderSnapshot:
+        """The trader's latest snapshot, or an empty placeholder if none has been built yet."""
+        snapshot = self.snapshots.get(name)
+        if snapshot is None:
+            snapshot = self._placeholders.get(name)
+            if snapshot is None:
+                trader = next(trader for trader in self.traders if trader.name == name)
+                snapshot = self._placeholders[name] = trader.placeholder_snapshot()
+        return snapshot
 
 
 class TraderView:
-    def __init__(self, trader: Trader):
+    def __init__(self, trader: Trader, snapshots: SnapshotService):
         self.trader = trader
+        self.snapshots = snapshots
         self.portfolio_value = None
         self.chart = None
         self.holdings_table = None
         self.transactions_table = None
+        self.seen = None
 
     def make_ui(self):
         with gr.Column():
             gr.HTML(self.trader.get_title())
             with gr.Row():
-                self.portfolio_value = gr.HTML(self.trader.get_portfolio_value)
+                self.portfolio_value = gr.HTML()
             with gr.Row():
-                self.chart = gr.Plot(
-                    self.trader.get_portfolio_value_chart, container=True, show_label=False
-                )
+                self.chart = gr.Plot(container=True, show_label=False)
             with gr.Row(variant="panel"):
-                self.log = gr.HTML(self.trader.get_logs)
+                self.log = gr.HTML()
             with gr.Row():
                 self.holdings_table = gr.Dataframe(
-                    value=self.trader.get_holdings_df,
                     label="Holdings",
                     headers=["Symbol", "Quantity"],
                     row_count=(5, "dynamic"),
@@ -124,7 +393,6 @@ class TraderView:
                 )
             with gr.Row():
                 self.transactions_table = gr.Dataframe(
-                    value=self.trader.get_transactions_df,
                     label="Recent Transactions",
                     headers=["Timestamp", "Symbol", "Quantity", "Price", "Rationale"],
                     row_count=(5, "dynamic"),
@@ -133,54 +401,205 @@ class TraderView:
                     elem_classes=["dataframe-fix"],
                 )
 
-        timer = gr.Timer(value=120)
+        # The component versions this session last rendered; filled in on page load with the initial values
+        self.seen = gr.State({})
+        timer = gr.Timer(value=SESSION_REFRESH_INTERVAL)
         timer.tick(
             fn=self.refresh,
-            inputs=[],
-            outputs=[
-                self.portfolio_value,
-                self.chart,
-                self.holdings_table,
-                self.transactions_table,
-            ],
+            inputs=[self.seen],
+            outputs=self.outputs(),
             show_progress="hidden",
             queue=False,
         )
-        log_timer = gr.Timer(value=0.5)
-        log_timer.tick(
-            fn=self.trader.get_logs,
-            inputs=[self.log],
-            outputs=[self.log],
+
+    def outputs(self) -> list:
+        return [self.portfolio_value, self.chart, self.holdings_table, self.transactions_table, self.seen]
+
+    def load(self):
+        """Every component's value on page load, with the versions they come from."""
+        return self.refresh({})
+
+    def refresh(self, seen: dict[str, int]):
+        """Send only the components that changed since this session last rendered them."""
+        # Values and versions both come from this one snapshot, which the service thread may replace at any time
+        snapshot = self.snapshots.get(self.trader.name)
+        updates, versions = [], {}
+        for component in COMPONENTS:
+            version, value = snapshot.components[component]
+            updates.append(gr.update() if seen.get(component) == version else value)
+            versions[component] = version
+        return (*updates, versions)
+
+
+# Main UI construction
+class LeaderboardView:
+    """Every trader ranked by portfolio value, a page at a time, from the snapshot service's shared copy."""
+
+    def __init__(self, snapshots: SnapshotService):
+        self.snapshots = snapshots
+        self.table = None
+        self.page_label = None
+        self.page = None
+        self.seen = None
+
+    def page_count(self) -> int:
+        return max(1, -(-len(self.snapshots.leaderboard[1]) // LEADERBOARD_PAGE_SIZE))
+
+    def render(self, page: int):
+        rows = self.snapshots.leaderboard[1][page * LEADERBOARD_PAGE_SIZE : (page + 1) * LEADERBOARD_PAGE_SIZE]
+        label = f"<div style='text-align: center'>Page {page + 1} of {self.page_count()}</div>"
+        return pd.DataFrame(list(rows), columns=LEADERBOARD_COLUMNS), label
+
+    def make_ui(self):
+        self.page = gr.State(0)
+        self.seen = gr.State(0)
+        with gr.Column():
+            self.table = gr.Dataframe(
+                value=lambda: self.render(0)[0],
+                label="Leaderboard",
+                headers=LEADERBOARD_COLUMNS,
+                row_count=(LEADERBOARD_PAGE_SIZE, "dynamic"),
+                col_count=(len(LEADERBOARD_COLUMNS), "fixed"),
+                elem_classes=["dataframe-fix"],
+            )
+            with gr.Row():
+                previous_button = gr.Button("Previous")
+                self.page_label = gr.HTML(lambda: self.render(0)[1])
+                next_button = gr.Button("Next")
+        for button, step in ((previous_button, -1), (next_button, 1)):
+            button.click(
+                lambda page, step=step: self.turn(page, step),
+                inputs=[self.page],
+                outputs=[self.table, self.page_label, self.page],
+                queue=False,
+            )
+        timer = gr.Timer(value=SESSION_REFRESH_INTERVAL)
+        timer.tick(
+            fn=self.refresh,
+            inputs=[self.page, self.seen],
+            outputs=[self.table, self.page_label, self.seen],
             show_progress="hidden",
             queue=False,
         )
 
-    def refresh(self):
-        self.trader.reload()
-        return (
-            self.trader.get_portfolio_value(),
-            self.trader.get_portfolio_value_chart(),
-            self.trader.get_holdings_df(),
-            self.trader.get_transactions_df(),
+    def turn(self, page: int, step: int):
+        page = min(max(page + step, 0), self.page_count() - 1)
+        return (*self.render(page), page)
+
+    def refresh(self, page: int, seen: int):
+        version = self.snapshots.leaderboard[0]
+        if version == seen:
+            return gr.update(), gr.update(), seen
+        return (*self.render(min(page, self.page_count() - 1)), version)
+
+
+class LatencyView:
+    """Latency percentiles of the traders' spans over the last day, by span type, model or tool."""
+
+    def __init__(self, snapshots: SnapshotService):
+        self.snapshots = snapshots
+        self.group = None
+        self.table = None
+        self.seen = None
+
+    def render(self, group: str) -> pd.DataFrame:
+        rows = self.snapshots.latencies[1].get(group, ())
+        return pd.DataFrame(list(rows), columns=[group.title(), *LATENCY_COLUMNS])
+
+    def make_ui(self):
+        self.seen = gr.State(0)
+        with gr.Column():
+            self.group = gr.Radio(list(SPAN_GROUPS), value="type", label="Span latency by", container=False)
+            self.table = gr.Dataframe(
+                value=lambda: self.render("type"),
+                label=f"Span latency, last {LATENCY_WINDOW_HOURS} hours",
+                elem_classes=["dataframe-fix"],
+            )
+        self.group.change(self.render, inputs=[self.group], outputs=[self.table], queue=False)
+        timer = gr.Timer(value=SESSION_REFRESH_INTERVAL)
+        timer.tick(
+            fn=self.refresh,
+            inputs=[self.group, self.seen],
+            outputs=[self.table, self.seen],
+            show_progress="hidden",
+            queue=False,
         )
 
+    def refresh(self, group: str, seen: int):
+        version = self.snapshots.latencies[0]
+        if version == seen:
+            return gr.update(), seen
+        return self.render(group), version
+
+
+class CostView:
+    """What each trader's model calls have cost next to its profit or loss, from the snapshot service's shared copy."""
+
+    def __init__(self, snapshots: SnapshotService):
+        self.snapshots = snapshots
+        self.table = None
+        self.seen = None
+
+    def render(self) -> pd.DataFrame:
+        return pd.DataFrame(list(self.snapshots.costs[1]), columns=COST_COLUMNS)
+
+    def make_ui(self):
+        self.seen = gr.State(0)
+        with gr.Column():
+            self.table = gr.Dataframe(
+                value=self.render, label="Model costs against returns", elem_classes=["dataframe-fix"]
+            )
+        timer = gr.Timer(value=SESSION_REFRESH_INTERVAL)
+        timer.tick(
+            fn=self.refresh,
+            inputs=[self.seen],
+            outputs=[self.table, self.seen],
+            show_progress="hidden",
+            queue=False,
+        )
+
+    def refresh(self, seen: int):
+        version = self.snapshots.costs[0]
+        if version == seen:
+            return gr.update(), seen
+        return self.render(), version
+
 
-# Main UI construction
 def create_ui():
     """Create the main Gradio UI for the trading simulation"""
 
-    traders = [
+    featured = [
         Trader(trader_name, lastname, model_name)
-        for trader_name, lastname, model_name in zip(names, lastnames, short_model_names)
+        for trader_name, lastname, model_name in list(zip(names, lastnames, short_model_names))[:MAX_TRADER_COLUMNS]
     ]
-    trader_views = [TraderView(trader) for trader in traders]
+    models = None
+    if len(names) > MAX_TRADER_COLUMNS:
+        models = {trader_name.lower(): model_name for trader_name, model_name in zip(names, short_model_names)}
+    snapshots = SnapshotService(featured, models=models)
+    snapshots.start()
+    trader_views = [TraderView(trader, snapshots) for trader in featured]
 
     with gr.Blocks(
         title="Traders", css=css, js=js, theme=gr.themes.Default(primary_hue="sky"), fill_width=True
     ) as ui:
+        if models is not None:
+            with gr.Row():
+                LeaderboardView(snapshots).make_ui()
         with gr.Row():
             for trader_view in trader_views:
                 trader_view.make_ui()
+        with gr.Row():
+            LatencyView(snapshots).make_ui()
+            CostView(snapshots).make_ui()
+        for trader_view in trader_views:
+            # One long-lived stream per session and trader, fed by the shared log tailer
+            ui.load(
+                trader_view.trader.stream_logs,
+                outputs=[trader_view.log],
+                show_progress="hidden",
+                concurrency_limit=None,
+            )
+            ui.load(trader_view.load, outputs=trader_view.outputs(), queue=False)
 
     return ui
 
@@ -0,0 +1,416 @@
+"""
+Replay historical bars through the trading floor and score each trader.
+
+The bars are injected into market.py through the market simulator: the simulated clock is set
+to each bar's time, and share prices are read from the bar data. At each step every Trader runs
+its usual agent cycle, with the accounts, market and push tools of trading_server served in this
+process, so the tools see the simulated clock and the bars and trade in the backtest database.
+The research tool is left out, as it would search today's web rather than the past.
+
+By default each trader's model is a stub that looks up a few prices and makes one random trade
+per cycle, so a backtest runs offline. With --models each trader uses its configured model: run
+once with LLM_CACHE=record, then with LLM_CACHE=replay and the same --db (where the responses are
+stored) to repeat the backtest without calling the providers.
+
+The portfolio accounting afterwards rebuilds every trader's holdings, cash and equity on every bar
+from the ledger with NumPy, rather than revaluing accounts bar by bar.
+
+Usage: uv run backtest.py [bars.csv] [--every BARS] [--models] [--db PATH]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+from contextlib import AsyncExitStack, contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import httpx
+import numpy as np
+from agents import Agent, OpenAIChatCompletionsModel, set_trace_processors
+from agents.mcp import MCPServer
+from mcp.server.fastmcp import FastMCP
+from mcp.shared.memory import create_connected_server_and_client_session
+from openai.types.chat import ChatCompletion
+import database
+import llm_cache
+import market
+import market_simulator
+import trading_server
+from accounts import Account, INITIAL_BALANCE
+from database import read_transactions
+from notifier import FileSink, notifier
+from reset import reset_traders
+from templates import trader_instructions
+from tracers import LogTracer
+from traders import Trader, get_model
+from trading_floor import trader_configs
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class BarData:
+    """Closing prices on a dense grid of bar times by symbols, forward-filled where a symbol has no bar."""
+
+    def __init__(self, times: list[str], symbols: list[str], closes: np.ndarray):
+        self.times = times
+        self.symbols = symbols
+        self.closes = closes
+        self.columns = {symbol: index for index, symbol in enumerate(symbols)}
+        self.step = 0
+
+    @classmethod
+    def from_csv(cls, path: str) -> "BarData":
+        """Read bars with timestamp, symbol and close columns."""
+        import pandas as pd
+
+        bars = pd.read_csv(path, dtype={"timestamp": str, "symbol": str, "close": float})
+        bars["symbol"] = bars["symbol"].str.upper()
+        grid = bars.pivot_table(index="timestamp", columns="symbol", values="close", aggfunc="last").sort_index()
+        grid = grid.ffill().bfill()
+        return cls(list(grid.index), list(grid.columns), grid.to_numpy(dtype=np.float64))
+
+    @classmethod
+    def generate(cls, symbols: list[str], days: int, start: str = "2022-01-03", seed: int = 42) -> "BarData":
+        """Daily closes following correlated geometric Brownian motion, for tests and benchmarks."""
+        rng = np.random.default_rng(seed)
+        start_day = datetime.strptime(start, "%Y-%m-%d")
+        times, day = [], start_day
+        while len(times) < days:
+            if market_simulator.is_trading_day(day.date()):
+                times.append((day + timedelta(hours=16)).strftime(TIME_FORMAT))
+            day += timedelta(days=1)
+        drift = rng.uniform(-0.05, 0.15, len(symbols))
+        volatility = rng.uniform(0.15, 0.6, len(symbols))
+        correlation = market_simulator.SIMULATION_CORRELATION
+        shocks = np.sqrt(correlation) * rng.standard_normal((days, 1)) + np.sqrt(1 - correlation) * rng.standard_normal(
+            (days, len(symbols))
+        )
+        dt = 1 / market_simulator.TRADING_DAYS_PER_YEAR
+        returns = (drift - volatility**2 / 2) * dt + volatility * np.sqrt(dt) * shocks
+        closes = rng.uniform(10, 500, len(symbols)) * np.exp(np.cumsum(returns, axis=0))
+        return cls(times, list(symbols), np.round(closes, 2))
+
+    def moment(self, step: int) -> datetime:
+        return datetime.strptime(self.times[step], TIME_FORMAT)
+
+    def price(self, symbol: str, moment: datetime) -> float:
+        """The close at the current step; the market simulator calls this with its clock's time."""
+        column = self.columns.get(symbol.upper())
+        return 0.0 if column is None else float(self.closes[self.step, column])
+
+
+@contextmanager
+def replay(bars: BarData, db: str | None = None):
+    """
+    Route market.py's prices and clock to the bars, the accounts to a separate database (a
+    temporary one unless db is given) and push notifications to a file, for the duration of a backtest.
+    """
+    original = market.use_simulator, market_simulator.get_market, market_simulator.clock.fixed, database.DB, notifier.sink
+    with tempfile.TemporaryDirectory() as directory:
+        database.log_writer.flush()
+        database.span_writer.flush()
+        database.run_cost_writer.flush()
+        database.close_connections()
+        database.DB = db or os.path.join(directory, "backtest.db")
+        market.use_simulator = True
+        market_simulator.get_market = lambda: bars
+        notifier.sink = FileSink(os.path.join(directory, "notifications.jsonl"))
+        try:
+            yield bars
+        finally:
+            database.log_writer.flush()
+            database.span_writer.flush()
+            database.run_cost_writer.flush()
+            database.close_connections()
+            (
+                market.use_simulator,
+                market_simulator.get_market,
+                market_simulator.clock.fixed,
+                database.DB,
+                notifier.sink,
+            ) = original
+
+
+class InProcessMCPServer(MCPServer):
+    """An MCP server run in this process over in-memory streams, so its tools share the backtest's clock, bars and database."""
+
+    def __init__(self, server: FastMCP):
+        super().__init__()
+        self.server = server
+        self.session = None
+        self._stack = None
+
+    @property
+    def name(self) -> str:
+        return self.server.name
+
+    async def connect(self):
+        self._stack = AsyncExitStack()
+        self.session = await self._stack.enter_async_context(create_connected_server_and_client_session(self.server))
+
+    async def cleanup(self):
+        if self._stack is not None:
+            await self._stack.aclose()
+            self._stack, self.session = None, None
+
+    async def __aenter__(self) -> "InProcessMCPServer":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.cleanup()
+
+    async def list_tools(self, run_context=None, agent=None):
+        return (await self.session.list_tools()).tools
+
+    async def call_tool(self, tool_name: str, arguments: dict | None):
+        return await self.session.call_tool(tool_name, arguments)
+
+    async def list_prompts(self):
+        return await self.session.list_prompts()
+
+    async def get_prompt(self, name: str, arguments: dict | None = None):
+        return await self.session.get_prompt(name, arguments)
+
+    async def read_resource(self, uri: str) -> str:
+        result = await self.session.read_resource(uri)
+        return result.contents[0].text
+
+
+def tool_output(content: str):
+    """A tool's return value, from the JSON of the MCP text content the agents SDK puts in its message."""
+    try:
+        value = json.loads(content)
+    except json.JSONDecodeError:
+        return content
+    if isinstance(value, dict) and value.get("type") == "text":
+        try:
+            return json.loads(value["text"])
+        except json.JSONDecodeError:
+            return value["text"]
+    return value
+
+
+class StubCompletions:
+    """
+    Plays a trader's model without calling one: it reads the account's holdings and balance, prices
+    a few symbols, makes at most one random trade, then finishes, all through the trader's tools.
+    """
+
+    def __init__(self, name: str, symbols: list[str], seed: int = 0):
+        self.name = name
+        self.symbols = symbols
+        self.seed = seed
+
+    async def create(self, *, model: str, messages: list[dict], **arguments) -> ChatCompletion:
+        names = {
+            call["id"]: call["function"]["name"]
+            for message in messages
+            if message.get("role") == "assistant"
+            for call in message.get("tool_calls") or []
+        }
+        results = {
+            names.get(message["tool_call_id"]): tool_output(message["content"])
+            for message in messages
+            if message.get("role") == "tool"
+        }
+        rng = random.Random(f"{self.seed}-{self.name}-{market.market_time()}")
+        if "get_holdings" not in results:
+            calls = [("get_holdings", {"name": self.name}), ("get_balance", {"name": self.name})]
+        elif "lookup_share_prices" not in results:
+            holdings = results["get_holdings"] if isinstance(results["get_holdings"], dict) else {}
+            sample = rng.sample(self.symbols, min(3, len(self.symbols)))
+            calls = [("lookup_share_prices", {"symbols": sorted(set(holdings) | set(sample))})]
+        elif "buy_shares" not in results and "sell_shares" not in results:
+            calls = [call for call in [self.choose_trade(rng, results)] if call]
+        else:
+            calls = []
+        return completion(model, calls, len(messages))
+
+    def choose_trade(self, rng: random.Random, results: dict) -> tuple[str, dict] | None:
+        holdings = results["get_holdings"] if isinstance(results["get_holdings"], dict) else {}
+        balance = float(results["get_balance"])
+        prices = results["lookup_share_prices"]
+        if holdings and rng.random() < 0.4:
+            symbol = rng.choice(sorted(holdings))
+            quantity = rng.randint(1, holdings[symbol])
+            return "sell_shares", {"name": self.name, "symbol": symbol, "quantity": quantity, "rationale": "Backtest"}
+        symbol = rng.choice(sorted(prices))
+        affordable = int(balance * 0.2 / (prices[symbol] * 1.01)) if prices[symbol] else 0
+        if not affordable:
+            return None
+        quantity = rng.randint(1, affordable)
+        return "buy_shares", {"name": self.name, "symbol": symbol, "quantity": quantity, "rationale": "Backtest"}
+
+
+def completion(model: str, calls: list[tuple[str, dict]], turn: int) -> ChatCompletion:
+    """A chat completion that calls the given tools, or finishes the run when there are none."""
+    message = {"role": "assistant", "content": None if calls else "Done for this cycle."}
+    if calls:
+        message["tool_calls"] = [
+            {"id": f"call_{turn}_{index}", "type": "function", "function": {"name": name, "arguments": json.dumps(args)}}
+            for index, (name, args) in enumerate(calls)
+        ]
+    return ChatCompletion.model_validate({
+        "id": f"stub-{turn}",
+        "object": "chat.completion",
+        "created": 0,
+        "model": model,
+        "choices": [{"index": 0, "finish_reason": "tool_calls" if calls else "stop", "message": message}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    })
+
+
+class StubClient:
+    """Stands in for an AsyncOpenAI client in OpenAIChatCompletionsModel, answering with StubCompletions."""
+
+    base_url = httpx.URL("http://stub.invalid/")
+
+    def __init__(self, name: str, symbols: list[str], seed: int = 0):
+        self.chat = SimpleNamespace(completions=StubCompletions(name, symbols, seed))
+
+
+class BacktestTrader(Trader):
+    """
+    A Trader whose cycles run against the in-process server, without the research tool, and with
+    the given model in place of its configured one if there is one.
+    """
+
+    def __init__(self, name: str, lastname: str, model_name: str, server: InProcessMCPServer, model=None):
+        super().__init__(name, lastname, model_name)
+        self.server = server
+        self.model = model
+
+    async def create_agent(self, trader_mcp_servers, researcher_mcp_servers) -> Agent:
+        self.agent = Agent(
+            name=self.name,
+            instructions=trader_instructions(self.name),
+            model=self.model or get_model(self.model_name),
+            mcp_servers=trader_mcp_servers,
+            hooks=self.budget,
+        )
+        return self.agent
+
+    async def get_account_report(self) -> str:
+        return await self.server.read_resource(f"accounts://digest/{self.name}")
+
+    async def get_strategy(self) -> str:
+        return await self.server.read_resource(f"accounts://strategy/{self.name}")
+
+    async def run_with_mcp_servers(self):
+        await self.run_agent([self.server], [])
+
+
+@dataclass
+class TraderResult:
+    name: str
+    equity: np.ndarray
+    drawdown: np.ndarray
+    total_return: float
+    max_drawdown: float
+    sharpe: float
+    turnover: float
+    trades: int
+
+    def summary(self) -> str:
+        return (
+            f"{self.name:<16} return {self.total_return:>8.2%}   max drawdown {self.max_drawdown:>8.2%}"
+            f"   sharpe {self.sharpe:>6.2f}   turnover {self.turnover:>6.2f}x   trades {self.trades:>6,}"
+        )
+
+
+def evaluate(name: str, bars: BarData, periods_per_year: float = market_simulator.TRADING_DAYS_PER_YEAR) -> TraderResult:
+    """Score one trader from its ledger: every bar's holdings, cash and equity, computed as whole arrays."""
+    transactions = read_transactions(name)
+    steps = len(bars.times)
+    quantities = np.zeros((steps, len(bars.symbols)))
+    cash_flows = np.zeros(steps)
+    traded_value = 0.0
+    if transactions:
+        rows = np.searchsorted(bars.times, [transaction["timestamp"] for transaction in transactions], side="right") - 1
+        rows = np.clip(rows, 0, steps - 1)
+        columns = np.array([bars.columns.get(transaction["symbol"].upper(), -1) for transaction in transactions])
+        quantity = np.array([transaction["quantity"] for transaction in transactions], dtype=np.float64)
+        price = np.array([transaction["price"] for transaction in transactions])
+        known = columns >= 0
+        np.add.at(quantities, (rows[known], columns[known]), quantity[known])
+        np.add.at(cash_flows, rows, -quantity * price)
+        traded_value = float(np.abs(quantity * price).sum())
+    holdings = np.cumsum(quantities, axis=0)
+    cash = INITIAL_BALANCE + np.cumsum(cash_flows)
+    equity = cash + np.einsum("ts,ts->t", holdings, bars.closes)
+    peak = np.maximum.accumulate(equity)
+    drawdown = equity / peak - 1
+    returns = np.diff(equity) / equity[:-1]
+    volatility = returns.std() if len(returns) > 1 else 0.0
+    sharpe = float(returns.mean() / volatility * np.sqrt(periods_per_year)) if volatility > 0 else 0.0
+    return TraderResult(
+        name=name,
+        equity=equity,
+        drawdown=drawdown,
+        total_return=float(equity[-1] / INITIAL_BALANCE - 1),
+        max_drawdown=float(drawdown.min()),
+        sharpe=sharpe,
+        turnover=traded_value / float(equity.mean()),
+        trades=len(transactions),
+    )
+
+
+async def run_backtest(
+    bars: BarData, configs: list[dict], every: int = 1, db: str | None = None, stub: bool = True
+) -> dict[str, TraderResult]:
+    """
+    Reset the configured traders' accounts, run each of their cycles once per `every` bars over
+    the whole dataset, then score them. With stub, the traders' models are StubCompletions.
+    """
+    with replay(bars, db):
+        reset_traders()
+        for config in configs:
+            account = Account.get(config["name"])
+            account.reset(account.get_strategy())
+        async with InProcessMCPServer(trading_server.mcp) as server:
+            traders = [
+                BacktestTrader(
+                    config["name"],
+                    config["lastname"],
+                    "stub" if stub else config["model_name"],
+                    server,
+                    OpenAIChatCompletionsModel("stub", StubClient(config["name"], bars.symbols)) if stub else None,
+                )
+                for config in configs
+            ]
+            for step in range(0, len(bars.times), every):
+                bars.step = step
+                market_simulator.clock.set(bars.moment(step))
+                await asyncio.gather(*[trader.run() for trader in traders])
+        return {trader.name: evaluate(trader.name, bars) for trader in traders}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the traders over historical bars")
+    parser.add_argument("bars", nargs="?", help="CSV of bars with timestamp, symbol and close columns")
+    parser.add_argument("--every", type=int, default=1, help="run a trading cycle every this many bars")
+    parser.add_argument("--models", action="store_true", help="use the traders' configured models, not the stub")
+    parser.add_argument("--db", help="keep the backtest's accounts, logs and recorded responses in this database")
+    args = parser.parse_args()
+    # Traces go to the backtest database only; the LogTracer also feeds the budget caps
+    set_trace_processors([LogTracer()])
+    # The in-process server would otherwise log every tool call
+    logging.getLogger("mcp").setLevel(logging.WARNING)
+    symbols = [f"SIM{index:03d}" for index in range(100)]
+    bars = BarData.from_csv(args.bars) if args.bars else BarData.generate(symbols, days=252)
+    results = asyncio.run(run_backtest(bars, trader_configs, args.every, args.db, stub=not args.models))
+    print(f"{len(bars.times):,} bars over {len(bars.symbols):,} symbols, {bars.times[0]} to {bars.times[-1]}")
+    for result in results.values():
+        print(result.summary())
+    if llm_cache.LLM_CACHE_MODE != "passthrough":
+        print(f"LLM cache: {llm_cache.stats['hits']} hits, {llm_cache.stats['misses']} misses")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,589 @@
+"""
+Micro-benchmarks for the trading floor's storage, market and MCP plumbing.
+
+Usage: uv run benchmarks.py [name ...]   (runs every benchmark when no name is given)
+
+Each benchmark works against a scratch database in a temporary directory,
+so it never touches the real accounts.db.
+"""
+
+import json
+import os
+import sys
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import database
+
+BENCHMARKS = {}
+
+
+def benchmark(fn):
+    BENCHMARKS[fn.__name__.removeprefix("bench_")] = fn
+    return fn
+
+
+@contextmanager
+def scratch_db():
+    """Point the database module at a fresh file for the duration of a benchmark."""
+    original = database.DB
+    with tempfile.TemporaryDirectory() as directory:
+        database.DB = os.path.join(directory, "bench.db")
+        database.init_db()
+        try:
+            yield database.DB
+        finally:
+            database.close_connections()
+            database.DB = original
+
+
+def run_threads(target, count: int, seconds: float) -> int:
+    """Run target(stop) on count threads for the given time and return the total op count."""
+    stop = threading.Event()
+    counts = [0] * count
+
+    def worker(index):
+        while not stop.is_set():
+            target()
+            counts[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts)
+
+
+# The storage layer as it was before connection pooling: a fresh connection and a commit per call,
+# with each account stored as one JSON blob in a table of its own, as the accounts table once was
+
+
+def legacy_write_log(db, name, type, message):
+    with sqlite3.connect(db) as conn:
+        conn.execute(
+            "INSERT INTO logs (name, datetime, type, message) VALUES (?, datetime('now'), ?, ?)",
+            (name, type, message),
+        )
+        conn.commit()
+
+
+def legacy_write_account(db, name, account):
+    with sqlite3.connect(db) as conn:
+        conn.execute(
+            "INSERT INTO legacy_accounts (name, account) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET account=excluded.account",
+            (name, json.dumps(account)),
+        )
+        conn.commit()
+
+
+def legacy_read_account(db, name):
+    with sqlite3.connect(db) as conn:
+        return conn.execute("SELECT account FROM legacy_accounts WHERE name = ?", (name,)).fetchone()
+
+
+@benchmark
+def bench_database(readers: int = 4, writers: int = 2, seconds: float = 2.0):
+    """Ops/sec for concurrent readers and writers, per-call connections vs the pooled WAL layer."""
+    with scratch_db() as db:
+        database.write_account("bench", {"name": "bench", "balance": 0.0})
+        database.close_connections()
+        with sqlite3.connect(db) as conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute("CREATE TABLE legacy_accounts (name TEXT PRIMARY KEY, account TEXT)")
+        modes = {
+            "legacy": (
+                lambda: legacy_read_account(db, "bench"),
+                lambda: legacy_write_account(db, "bench", {"name": "bench", "balance": 1.0}),
+            ),
+            "pooled": (
+                lambda: database.read_account("bench"),
+                lambda: database.write_account("bench", {"name": "bench", "balance": 1.0}),
+            ),
+        }
+        for mode, (read, write) in modes.items():
+            if mode == "pooled":
+                database.get_connection()  # switches the file into WAL mode
+            results = {}
+
+            def run(kind, target, count, results=results):
+                results[kind] = run_threads(target, count, seconds)
+
+            threads = [
+                threading.Thread(target=run, args=("reads", read, readers)),
+                threading.Thread(target=run, args=("writes", write, writers)),
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            print(
+                f"database [{mode:>6}] {readers} readers: {results['reads'] / seconds:>9,.0f} reads/s"
+                f"   {writers} writers: {results['writes'] / seconds:>8,.0f} writes/s"
+            )
+
+
+@benchmark
+def bench_log_writer(count: int = 20_000):
+    """Hot-path cost of write_log: a synchronous insert and commit vs the buffered log writer."""
+    with scratch_db() as db:
+        start = time.perf_counter()
+        for i in range(count // 20):
+            legacy_write_log(db, "bench", "span", f"message {i}")
+        legacy = (time.perf_counter() - start) / (count // 20)
+
+        start = time.perf_counter()
+        for i in range(count):
+            database.write_log("bench", "span", f"message {i}")
+        buffered = (time.perf_counter() - start) / count
+        start = time.perf_counter()
+        database.log_writer.flush()
+        drain = time.perf_counter() - start
+        print(
+            f"log_writer  sync: {legacy * 1e6:>8.1f} us/call   buffered: {buffered * 1e6:>6.1f} us/call"
+            f"   drain of the last batch: {drain * 1e3:.1f} ms"
+        )
+
+
+@benchmark
+def bench_logs(rows: int = 10_000_000, names: int = 8, reads: int = 1000):
+    """read_log latency on a large logs table: a scan and sort by datetime vs the (name, id) index."""
+    import random
+    from datetime import datetime, timedelta
+
+    types = ["trace", "span", "account", "function", "generation"]
+    with scratch_db() as db:
+        start = time.perf_counter()
+        origin = datetime(2025, 1, 1)
+        with database.transaction() as conn:
+            for chunk in range(0, rows, 100_000):
+                conn.executemany(
+                    "INSERT INTO logs (name, datetime, type, message) VALUES (?, ?, ?, ?)",
+                    (
+                        (
+                            f"trader{index % names}",
+                            (origin + timedelta(seconds=index // 10)).strftime("%Y-%m-%d %H:%M:%S"),
+                            types[index % len(types)],
+                            f"message {index}",
+                        )
+                        for index in range(chunk, min(chunk + 100_000, rows))
+                    ),
+                )
+        populate = time.perf_counter() - start
+
+        random.seed(0)
+        connection = sqlite3.connect(db)
+        start = time.perf_counter()
+        for _ in range(3):
+            connection.execute(
+                "SELECT datetime, type, message FROM logs NOT INDEXED WHERE name = ? ORDER BY datetime DESC LIMIT 10",
+                (f"trader{random.randrange(names)}",),
+            ).fetchall()
+        legacy = (time.perf_counter() - start) / 3
+        connection.close()
+
+        start = time.perf_counter()
+        for _ in range(reads):
+            list(database.read_log(f"trader{random.randrange(names)}", 10))
+        indexed = (time.perf_counter() - start) / reads
+        start = time.perf_counter()
+        for _ in range(reads):
+            database.query_logs(name=f"trader{random.randrange(names)}", type="account", limit=10)
+        by_type = (time.perf_counter() - start) / reads
+        print(
+            f"logs  {rows:,} rows (inserted in {populate:.0f} s)   read_log scan and sort: {legacy * 1e3:>8.1f} ms"
+            f"   indexed: {indexed * 1e3:.3f} ms   by name and type: {by_type * 1e3:.3f} ms"
+        )
+
+
+@benchmark
+def bench_account_history(history: int = 100_000, trades: int = 200):
+    """Cost of persisting one trade on an account with a long history: JSON blob vs append-only ledger."""
+    from accounts import Account, Transaction
+
+    with scratch_db() as db:
+        transaction = {"symbol": "AAPL", "quantity": 1, "price": 100.0, "timestamp": "2025-01-01 00:00:00", "rationale": "bench"}
+        state = {"name": "bench", "balance": 1_000_000.0, "strategy": "", "holdings": {"AAPL": history}}
+        blob = {**state, "transactions": [transaction] * history, "portfolio_value_time_series": []}
+        start = time.perf_counter()
+        for _ in range(trades // 20):
+            with sqlite3.connect(db) as conn:
+                loaded = json.loads(json.dumps(blob))
+                loaded["transactions"].append(transaction)
+                conn.execute("DROP TABLE IF EXISTS legacy")
+                conn.execute("CREATE TABLE legacy (name TEXT PRIMARY KEY, account TEXT)")
+                conn.execute("INSERT INTO legacy VALUES (?, ?)", ("bench", json.dumps(loaded)))
+        legacy = (time.perf_counter() - start) / (trades // 20)
+
+        database.write_trades("bench", state, [transaction] * history)
+        # The seeded account has no lots yet; the first load rebuilds and saves them, so do it before timing
+        Account.get("bench")
+        start = time.perf_counter()
+        for _ in range(trades):
+            account = Account.get("bench")
+            account.balance -= 100.0
+            account.holdings["AAPL"] += 1
+            account.record_transaction(Transaction(**transaction))
+        ledger = (time.perf_counter() - start) / trades
+        print(
+            f"account_history  {history:,} past transactions   json blob: {legacy * 1e3:>7.2f} ms/trade"
+            f"   ledger: {ledger * 1e3:>5.2f} ms/trade"
+        )
+
+
+@benchmark
+def bench_market_snapshot(tickers: int = 12_000, lookups: int = 10_000):
+    """First-price latency and lookup cost: JSON market row vs memory-mapped snapshot."""
+    import random
+    import market_snapshot
+
+    random.seed(0)
+    data = {f"T{i:05d}": random.uniform(1, 500) for i in range(tickers)}
+    symbols = random.choices(list(data), k=lookups)
+    original_dir = market_snapshot.SNAPSHOT_DIR
+    with scratch_db(), tempfile.TemporaryDirectory() as directory:
+        market_snapshot.SNAPSHOT_DIR = directory
+        market_snapshot.open_snapshot.cache_clear()
+        database.write_market("2025-01-02", data)
+        start = time.perf_counter()
+        database.read_market("2025-01-02").get(symbols[0])
+        json_first = time.perf_counter() - start
+
+        market_snapshot.import_market_rows()
+        start = time.perf_counter()
+        snapshot = market_snapshot.MarketSnapshot(market_snapshot.snapshot_path("2025-01-02"))
+        snapshot.get(symbols[0])
+        mmap_first = time.perf_counter() - start
+        start = time.perf_counter()
+        for symbol in symbols:
+            snapshot.get(symbol)
+        lookup = (time.perf_counter() - start) / lookups
+        print(
+            f"market_snapshot  {tickers:,} tickers   first price from json: {json_first * 1e3:>6.2f} ms"
+            f"   from mmap: {mmap_first * 1e3:>5.3f} ms   lookup: {lookup * 1e6:.1f} us"
+        )
+        market_snapshot.SNAPSHOT_DIR = original_dir
+        market_snapshot.open_snapshot.cache_clear()
+
+
+@benchmark
+def bench_account_digest(trades: int = 1000, checkpoints: tuple = (10, 100, 1000)):
+    """Prompt tokens for the account as trades accumulate: the whole-ledger report, the paged report and the digest."""
+    import random
+    import accounts
+    from accounts import Account
+
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding("o200k_base")
+
+        def count_tokens(text: str) -> int:
+            return len(encoding.encode(text))
+    except ImportError:
+        def count_tokens(text: str) -> int:
+            return len(text) // 4  # the usual rough estimate for English and JSON
+
+    random.seed(0)
+    symbols = ["AAPL", "MSFT", "NVDA", "AMZN", "GOOG", "META", "TSLA", "JPM"]
+    rationale = "Momentum and earnings revisions support adding to this position while it remains within the strategy's risk limits."
+    original_prices = accounts.get_share_prices, accounts.get_share_price
+    accounts.get_share_prices = lambda holdings: {symbol: 100.0 for symbol in holdings}
+    accounts.get_share_price = lambda symbol: 100.0
+    with scratch_db():
+        account = Account.get("bench")
+        account.balance = 1e9
+        account.save()
+        for trade in range(1, trades + 1):
+            symbol = random.choice(symbols)
+            if account.holdings.get(symbol, 0) > 1 and random.random() < 0.4:
+                account.sell_shares(symbol, 1, rationale)
+            else:
+                account.buy_shares(symbol, random.randint(1, 5), rationale)
+            if trade in checkpoints:
+                account = Account.get("bench")
+                report, digest = account.report(), account.digest()
+                whole = json.dumps({**json.loads(report), "transactions": account.list_transactions()})
+                start = time.perf_counter()
+                account.digest()
+                cached = time.perf_counter() - start
+                print(
+                    f"account_digest  {trade:>5,} trades   whole ledger: {count_tokens(whole):>7,} tokens"
+                    f"   paged report: {count_tokens(report):>6,}   digest: {count_tokens(digest):>5,}"
+                    f"   cached digest: {cached * 1e3:.2f} ms"
+                )
+        database.log_writer.flush()
+    accounts.get_share_prices, accounts.get_share_price = original_prices
+
+
+class StubTrader:
+    """Stands in for traders.Trader in load tests: the same account work, with each model turn replaced by a fixed delay."""
+
+    def __init__(self, name: str, model_name: str = "stub", turns: int = 3, model_latency: float = 0.2):
+        self.name = name
+        self.model_name = model_name
+        self.turns = turns
+        self.model_latency = model_latency
+
+    async def run(self):
+        import asyncio
+        from accounts import Account
+
+        account = Account.get(self.name)
+        for _ in range(self.turns):
+            await asyncio.sleep(self.model_latency)
+            account.digest()
+        account.buy_shares("AAPL", 1, "Load test")
+
+
+def stub_share_prices(db: str | None = None):
+    """Fixed share prices, so load tests don't depend on a market data plan; optionally point at a database."""
+    import accounts
+
+    if db:
+        database.DB = db
+    accounts.get_share_prices = lambda holdings: {symbol: 100.0 for symbol in holdings}
+    accounts.get_share_price = lambda symbol: 100.0
+
+
+def run_stub_cycle(names: list[str]) -> float:
+    """Run one scheduler cycle over stub traders with no provider limits and return its duration."""
+    import asyncio
+    from scheduler import TraderScheduler, ProviderLimiter
+
+    async def cycle():
+        scheduler = TraderScheduler([StubTrader(name) for name in names], interval=3600, jitter=0)
+        scheduler.limiters["openai"] = ProviderLimiter(len(names), 1e9)
+        start = time.perf_counter()
+        scheduler.start_cycle()
+        await asyncio.gather(*scheduler.running.values())
+        return time.perf_counter() - start
+
+    return asyncio.run(cycle())
+
+
+@benchmark
+def bench_trading_floor(counts: tuple = (10, 50, 200), workers: int = min(os.cpu_count() or 1, 8)):
+    """Cycle time vs trader count with a stubbed model: one process vs traders sharded across worker processes."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    with scratch_db() as db:
+        stub_share_prices()
+        for count in counts:
+            names = [f"trader{index:04d}" for index in range(count)]
+            run_stub_cycle(names)  # creates the accounts
+            single = run_stub_cycle(names)
+            with ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context("spawn"), initializer=stub_share_prices, initargs=(db,)
+            ) as pool:
+                list(pool.map(run_stub_cycle, [[] for _ in range(workers)]))  # start the workers
+                start = time.perf_counter()
+                list(pool.map(run_stub_cycle, [names[index::workers] for index in range(workers)]))
+                sharded = time.perf_counter() - start
+            print(
+                f"trading_floor  {count:>4} traders   one process: {single:>6.2f} s/cycle"
+                f"   {workers} workers: {sharded:>6.2f} s/cycle"
+            )
+        database.log_writer.flush()
+
+
+@benchmark
+def bench_backtest(symbols: int = 500, years: int = 3, trades: int = 20_000):
+    """Portfolio accounting for a multi-year backtest: revaluing the account bar by bar vs vectorized NumPy."""
+    import random
+    import numpy as np
+    from backtest import BarData, evaluate
+
+    bars = BarData.generate([f"SIM{index:03d}" for index in range(symbols)], days=years * 252)
+    random.seed(0)
+    ledger = [
+        {
+            "symbol": random.choice(bars.symbols),
+            "quantity": random.choice([1, 2, 3, -1]),
+            "price": 100.0,
+            "timestamp": random.choice(bars.times),
+            "rationale": "bench",
+        }
+        for _ in range(trades)
+    ]
+    ledger.sort(key=lambda row: row["timestamp"])
+    with scratch_db():
+        database.write_trades("bench", {"name": "bench", "balance": 0.0}, ledger)
+        start = time.perf_counter()
+        holdings, cash, equity, index = {}, 10_000.0, [], 0
+        for step, moment in enumerate(bars.times):
+            while index < len(ledger) and ledger[index]["timestamp"] <= moment:
+                row = ledger[index]
+                holdings[row["symbol"]] = holdings.get(row["symbol"], 0) + row["quantity"]
+                cash -= row["quantity"] * row["price"]
+                index += 1
+            prices = bars.closes[step]
+            equity.append(cash + sum(quantity * prices[bars.columns[symbol]] for symbol, quantity in holdings.items()))
+        loop = time.perf_counter() - start
+        start = time.perf_counter()
+        result = evaluate("bench", bars)
+        vectorized = time.perf_counter() - start
+        assert np.allclose(result.equity, equity)
+        print(
+            f"backtest  {years} years x {symbols} symbols, {trades:,} trades   bar by bar: {loop * 1e3:>7.1f} ms"
+            f"   vectorized: {vectorized * 1e3:>6.1f} ms, including reading the ledger"
+        )
+
+
+@benchmark
+def bench_llm_cache(turns: int = 10, model_latency: float = 0.3):
+    """A multi-turn agent run against a stub provider: recording it vs replaying it from the cache."""
+    import asyncio
+    import types
+    from agents import Agent, Runner, OpenAIChatCompletionsModel, function_tool, set_tracing_disabled
+    from openai.types.chat import ChatCompletion
+    from llm_cache import CachingClient, stats
+
+    set_tracing_disabled(True)
+
+    @function_tool
+    def lookup_share_price(symbol: str) -> float:
+        """The price of a share."""
+        return 100.0
+
+    async def create(**arguments):
+        await asyncio.sleep(model_latency)
+        calls = sum(message.get("role") == "tool" for message in arguments["messages"])
+        if calls < turns:
+            function = {"name": "lookup_share_price", "arguments": '{"symbol": "AAPL"}'}
+            tool_call = {"id": f"call_{calls}", "type": "function", "function": function}
+            message = {"role": "assistant", "content": None, "tool_calls": [tool_call]}
+        else:
+            message = {"role": "assistant", "content": "Done"}
+        choice = {"index": 0, "finish_reason": "stop", "message": message}
+        return ChatCompletion.model_validate(
+            {"id": "stub", "object": "chat.completion", "created": 0, "model": arguments["model"], "choices": [choice]}
+        )
+
+    provider = types.SimpleNamespace(
+        base_url="https://stub.invalid/v1",
+        chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)),
+    )
+
+    async def run(mode):
+        model = OpenAIChatCompletionsModel(model="stub", openai_client=CachingClient(provider, mode))
+        agent = Agent(name="Bench", instructions="Look up prices", model=model, tools=[lookup_share_price])
+        start = time.perf_counter()
+        await Runner.run(agent, "Trade", max_turns=turns + 2)
+        return time.perf_counter() - start
+
+    with scratch_db():
+        record = asyncio.run(run("record"))
+        replay = asyncio.run(run("replay"))
+        print(
+            f"llm_cache  {turns + 1} model calls   record: {record * 1e3:>7.1f} ms   replay: {replay * 1e3:>6.1f} ms"
+            f"   hits {stats['hits']}, misses {stats['misses']}"
+        )
+
+
+@benchmark
+def bench_accounts_client(calls: int = 20):
+    """Per-call latency of an accounts server resource read: cold spawn vs warm pooled session."""
+    import asyncio
+    import mcp
+    from mcp import StdioServerParameters
+    from mcp.client.stdio import stdio_client
+    from session_pool import SessionPool
+
+    # The server runs under this interpreter rather than uv so the numbers exclude uv's own startup
+    params = StdioServerParameters(command=sys.executable, args=["accounts_server.py"], env=None)
+    uri = "accounts://strategy/bench"
+
+    async def cold():
+        async with stdio_client(params) as streams:
+            async with mcp.ClientSession(*streams) as session:
+                await session.initialize()
+                await session.read_resource(uri)
+
+    async def run():
+        start = time.perf_counter()
+        for _ in range(max(calls // 5, 1)):
+            await cold()
+        cold_latency = (time.perf_counter() - start) / max(calls // 5, 1)
+        async with SessionPool(params) as pool:
+            await pool.call(lambda session: session.read_resource(uri))
+            start = time.perf_counter()
+            for _ in range(calls):
+                await pool.call(lambda session: session.read_resource(uri))
+            warm_latency = (time.perf_counter() - start) / calls
+        print(
+            f"accounts_client  cold spawn: {cold_latency * 1e3:>7.1f} ms/call"
+            f"   warm session: {warm_latency * 1e3:>5.2f} ms/call"
+        )
+
+    asyncio.run(run())
+
+
+# Import-time budgets in milliseconds for the MCP servers launched for every trader, not counting
+# FastMCP itself, which every server pays and which this repo can't make faster
+SERVER_IMPORT_BUDGET_MS = {"accounts_server": 120, "market_server": 120, "push_server": 30, "trading_server": 180}
+
+
+def import_time(module: str, preload: str = "mcp.server.fastmcp") -> tuple[float, list[tuple[float, str]]]:
+    """
+    A module's cumulative import time in ms under python -X importtime, after preload has been
+    imported in the same process, and the module's slowest direct imports.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {preload}; import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total, children = 0.0, []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        if not name.startswith("  "):
+            # A top-level import, printed after everything it imported
+            if name.strip() == module:
+                total = int(cumulative) / 1000
+                break
+            children = []
+        elif not name.startswith("    "):
+            children.append((int(cumulative) / 1000, name.strip()))
+    return total, sorted(children, reverse=True)[:3]
+
+
+@benchmark
+def bench_server_imports(runs: int = 7):
+    """
+    Import time of each MCP server module on top of FastMCP's, against its budget. Each figure
+    is the fastest of several runs, as the least disturbed by whatever else the machine is doing.
+    """
+    for module, budget in SERVER_IMPORT_BUDGET_MS.items():
+        import_time(module)  # compile and cache the bytecode first
+        total, slowest = min(import_time(module) for _ in range(runs))
+        status = "ok" if total <= budget else "OVER BUDGET"
+        print(
+            f"{module:<16} import beyond FastMCP: {total:>5.0f} ms   budget: {budget:>3} ms  {status:<11}"
+            "   slowest: " + ", ".join(f"{name} {ms:.0f} ms" for ms, name in slowest)
+        )
+
+
+def main(names: list[str]) -> None:
+    for name in names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            sys.exit(f"Unknown benchmark {name}; choose from {', '.join(BENCHMARKS)}")
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,128 @@
+"""
+Token usage and dollar cost of trader runs, and the budget caps that stop a run that costs too much.
+
+LogTracer feeds the usage of every model call (generation and response spans) to the usage meter,
+keyed by trace, so a trader run's total includes its researcher's calls. The budget hooks check that
+total before each model call and abort the run with BudgetExceeded once a cap has been passed.
+
+Settings, all optional:
+    MODEL_PRICES           a JSON file of {"model name": [input, output]} in USD per million tokens,
+                           added to (and overriding) the prices below
+    TRADER_RUN_BUDGET      USD one trader run may spend
+    TRADER_DAILY_BUDGET    USD one trader may spend per UTC day, across runs
+"""
+
+import json
+import os
+import threading
+from dataclasses import dataclass
+from agents import AgentHooks
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+# USD per million input and output tokens
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "deepseek-chat": (0.27, 1.10),
+    "deepseek-reasoner": (0.55, 2.19),
+    "gemini-2.5-flash-preview-04-17": (0.15, 0.60),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "grok-3-mini-beta": (0.30, 0.50),
+    "grok-3-beta": (3.00, 15.00),
+}
+
+MODEL_PRICES_FILE = os.getenv("MODEL_PRICES", "model_prices.json")
+if os.path.exists(MODEL_PRICES_FILE):
+    with open(MODEL_PRICES_FILE) as f:
+        MODEL_PRICES.update({model: tuple(prices) for model, prices in json.load(f).items()})
+
+TRADER_RUN_BUDGET = float(os.getenv("TRADER_RUN_BUDGET", "0")) or None
+TRADER_DAILY_BUDGET = float(os.getenv("TRADER_DAILY_BUDGET", "0")) or None
+
+unpriced_models = set()
+
+
+class BudgetExceeded(RuntimeError):
+    pass
+
+
+def model_price(model: str | None) -> tuple[float, float] | None:
+    """The price of a model, trying OpenRouter names such as "openai/gpt-4o-mini" without their prefix."""
+    if not model:
+        return None
+    return MODEL_PRICES.get(model) or MODEL_PRICES.get(model.split("/")[-1])
+
+
+def cost(model: str | None, input_tokens: int, output_tokens: int) -> float:
+    """The dollar cost of a model call; calls to models without a price count as free, with a warning."""
+    price = model_price(model)
+    if price is None:
+        if model not in unpriced_models:
+            unpriced_models.add(model)
+            print(f"No price for model {model}; its calls are counted as free")
+        return 0.0
+    return (input_tokens * price[0] + output_tokens * price[1]) / 1_000_000
+
+
+@dataclass
+class RunUsage:
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+
+
+class UsageMeter:
+    """Running token and cost totals per trace; the tracer adds to them from whichever thread ends a span."""
+
+    def __init__(self):
+        self._usage: dict[str, RunUsage] = {}
+        self._lock = threading.Lock()
+
+    def add(self, trace_id: str, model: str | None, input_tokens: int, output_tokens: int) -> None:
+        with self._lock:
+            usage = self._usage.setdefault(trace_id, RunUsage())
+            usage.requests += 1
+            usage.input_tokens += input_tokens
+            usage.output_tokens += output_tokens
+            usage.cost += cost(model, input_tokens, output_tokens)
+
+    def get(self, trace_id: str) -> RunUsage:
+        with self._lock:
+            return self._usage.get(trace_id, RunUsage())
+
+    def pop(self, trace_id: str) -> RunUsage:
+        with self._lock:
+            return self._usage.pop(trace_id, RunUsage())
+
+
+usage_meter = UsageMeter()
+
+
+class BudgetHooks(AgentHooks):
+    """
+    Raises BudgetExceeded before a model call once the run has spent its run budget, or the
+    trader has spent its daily budget counting what it spent earlier in the day.
+    """
+
+    def __init__(self, name: str, trace_id: str, spent_today: float = 0.0):
+        self.name = name
+        self.trace_id = trace_id
+        self.spent_today = spent_today
+
+    def check(self) -> None:
+        spent = usage_meter.get(self.trace_id).cost
+        if TRADER_RUN_BUDGET is not None and spent >= TRADER_RUN_BUDGET:
+            raise BudgetExceeded(f"{self.name} has spent ${spent:.4f} this run, over its ${TRADER_RUN_BUDGET} budget")
+        if TRADER_DAILY_BUDGET is not None and self.spent_today + spent >= TRADER_DAILY_BUDGET:
+            raise BudgetExceeded(
+                f"{self.name} has spent ${self.spent_today + spent:.4f} today, over its ${TRADER_DAILY_BUDGET} budget"
+            )
+
+    async def on_llm_start(self, context, agent, system_prompt, input_items) -> None:
+        self.check()
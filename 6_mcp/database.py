@@ -1,101 +1,1025 @@
 import sqlite3
 import json
-from datetime import datetime
+import math
+import os
+import threading
+import time
+import atexit
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
 load_dotenv(override=True)
 
 DB = "accounts.db"
 
+# Connection tuning shared by the accounts server, market server and the app, which all
+# hit the same file. WAL lets readers run alongside a writer; NORMAL sync is durable in WAL
+# mode except for the last transactions on power loss; busy_timeout makes a contended
+# writer wait rather than fail with "database is locked".
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
 
-with sqlite3.connect(DB) as conn:
-    cursor = conn.cursor()
-    cursor.execute('CREATE TABLE IF NOT EXISTS accounts (name TEXT PRIMARY KEY, account TEXT)')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            datetime DATETIME,
-            type TEXT,
-            message TEXT
+# Columns of the accounts table besides name; the JSON ones are stored serialized
+ACCOUNT_COLUMNS = {
+    "balance": "REAL",
+    "strategy": "TEXT",
+    "holdings": "TEXT",
+    "net_invested": "REAL",
+    "realized_pnl": "REAL",
+    "lots": "TEXT",
+}
+JSON_ACCOUNT_COLUMNS = {"holdings", "lots"}
+
+# Token usage and cost of each trader run, added to the scheduler's cycle metrics after they were introduced
+CYCLE_USAGE_COLUMNS = {"input_tokens": "INTEGER", "output_tokens": "INTEGER", "cost": "REAL"}
+
+# Rollups of portfolio value kept alongside the raw snapshots; a bucket is identified by the
+# prefix of the "%Y-%m-%d %H:%M:%S" timestamp of this length
+ROLLUP_PREFIX_LENGTHS = {"1m": 16, "1h": 13, "1d": 10}
+
+# Log entries are buffered in memory and inserted in batches by a background thread
+LOG_BUFFER_CAPACITY = 10_000
+LOG_FLUSH_SIZE = 200
+LOG_FLUSH_INTERVAL = 0.25
+
+# Log entries older than this are deleted by the log writer every LOG_COMPACT_INTERVAL seconds;
+# hourly counts per name and type are kept in log_rollups. A retention of 0 keeps everything.
+LOG_RETENTION_DAYS = float(os.getenv("LOG_RETENTION_DAYS", "30"))
+LOG_COMPACT_INTERVAL = 3600
+
+# Recorded in the database file by init_db; bump it whenever init_db changes, so existing
+# databases are brought up to date the next time they are opened
+SCHEMA_VERSION = 1
+
+_local = threading.local()
+_connections: list[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+_pool_generation = 0  # bumped by close_connections, so every thread drops its closed handles
+_schema_ready: set[str] = set()
+_schema_lock = threading.Lock()
+
+
+def connect(db: str = None) -> sqlite3.Connection:
+    """
+    Open a new tuned connection. Transactions are managed explicitly by transaction(),
+    so the connection runs in autocommit mode. Each pooled connection is only used by the
+    thread that opened it, but close_connections() may close it from another.
+    """
+    conn = sqlite3.connect(
+        db or DB,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        isolation_level=None,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=False,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Return this thread's pooled connection to DB, opening it on first use.
+    Connections are also keyed by process id so a forked child never reuses its parent's handle.
+    The first connection a process opens to a database file makes sure its schema is current.
+    """
+    key = (os.getpid(), DB)
+    pool = getattr(_local, "pool", None)
+    if pool is None or _local.pid != key[0] or _local.generation != _pool_generation:
+        pool = _local.pool = {}
+        _local.pid = key[0]
+        _local.generation = _pool_generation
+        _local.depth = 0
+    conn = pool.get(key)
+    if conn is None:
+        conn = pool[key] = connect(DB)
+        with _connections_lock:
+            _connections.append(conn)
+        ensure_schema(conn, DB)
+    return conn
+
+
+def ensure_schema(conn: sqlite3.Connection, db: str) -> None:
+    """
+    Run init_db unless the file's schema is already at SCHEMA_VERSION; usually a single read,
+    so starting a server doesn't take the write lock. Called once per database file per process.
+    """
+    if db in _schema_ready:
+        return
+    with _schema_lock:
+        if db in _schema_ready:
+            return
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            init_db()
+        _schema_ready.add(db)
+
+
+def close_connections() -> None:
+    """Close every pooled connection opened by this process; each thread opens a new one on its next use."""
+    global _pool_generation
+    with _connections_lock:
+        while _connections:
+            _connections.pop().close()
+        _pool_generation += 1
+    _local.pool = None
+    _local.depth = 0
+
+
+@contextmanager
+def transaction():
+    """
+    Run the enclosed statements in a single write transaction on the pooled connection.
+    Nested calls join the outermost transaction, which commits or rolls back as a whole.
+    """
+    conn = get_connection()
+    if _local.depth:
+        _local.depth += 1
+        try:
+            yield conn
+        finally:
+            _local.depth -= 1
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    _local.depth = 1
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
+    finally:
+        _local.depth = 0
+
+
+def init_db() -> None:
+    """Create any missing tables and indexes, and migrate data written by earlier versions."""
+    with transaction() as conn:
+        columns = ", ".join(f"{column} {type}" for column, type in ACCOUNT_COLUMNS.items())
+        conn.execute(f'CREATE TABLE IF NOT EXISTS accounts (name TEXT PRIMARY KEY, {columns})')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS transactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                symbol TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                price REAL NOT NULL,
+                timestamp TEXT NOT NULL,
+                rationale TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_name_timestamp ON transactions (name, timestamp)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_name_id ON transactions (name, id)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS portfolio_snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                value REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_snapshots_name_timestamp ON portfolio_snapshots (name, timestamp)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS portfolio_rollups (
+                name TEXT NOT NULL,
+                resolution TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                open REAL NOT NULL,
+                high REAL NOT NULL,
+                low REAL NOT NULL,
+                close REAL NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (name, resolution, bucket)
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                datetime DATETIME,
+                type TEXT,
+                message TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_name_id ON logs (name, id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_name_type_id ON logs (name, type, id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_datetime ON logs (datetime)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS spans (
+                span_id TEXT PRIMARY KEY,
+                trace_id TEXT,
+                parent_id TEXT,
+                name TEXT,
+                type TEXT,
+                label TEXT,
+                server TEXT,
+                model TEXT,
+                started_at TEXT,
+                start_monotonic REAL,
+                end_monotonic REAL,
+                duration_ms REAL,
+                error TEXT,
+                input_tokens INTEGER,
+                output_tokens INTEGER
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_spans_started_at ON spans (started_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_spans_type_started_at ON spans (type, started_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_spans_name_started_at ON spans (name, started_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_spans_trace_id ON spans (trace_id)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS log_rollups (
+                hour TEXT NOT NULL,
+                name TEXT NOT NULL,
+                type TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (hour, name, type)
+            )
+        ''')
+        conn.execute('CREATE TABLE IF NOT EXISTS market (date TEXT PRIMARY KEY, data TEXT)')
+        conn.execute('CREATE TABLE IF NOT EXISTS prices (symbol TEXT PRIMARY KEY, price REAL, fetched_at REAL)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                request TEXT,
+                response TEXT,
+                recorded_at TEXT
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cycle_metrics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                cycle INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                provider TEXT,
+                scheduled_at TEXT,
+                started_at TEXT,
+                finished_at TEXT,
+                wait_seconds REAL,
+                run_seconds REAL,
+                status TEXT
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS run_costs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                trace_id TEXT,
+                model TEXT,
+                started_at TEXT,
+                requests INTEGER,
+                input_tokens INTEGER,
+                output_tokens INTEGER,
+                cost REAL,
+                status TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_run_costs_name_started_at ON run_costs (name, started_at)')
+        migrate_accounts(conn)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(cycle_metrics)")}
+        for column, type in CYCLE_USAGE_COLUMNS.items():
+            if column not in columns:
+                conn.execute(f"ALTER TABLE cycle_metrics ADD COLUMN {column} {type}")
+        has_snapshots = conn.execute('SELECT 1 FROM portfolio_snapshots LIMIT 1').fetchone()
+        has_rollups = conn.execute('SELECT 1 FROM portfolio_rollups LIMIT 1').fetchone()
+        if has_snapshots and not has_rollups:
+            rebuild_portfolio_rollups(conn)
+        has_logs = conn.execute('SELECT 1 FROM logs LIMIT 1').fetchone()
+        has_log_rollups = conn.execute('SELECT 1 FROM log_rollups LIMIT 1').fetchone()
+        if has_logs and not has_log_rollups:
+            conn.execute('''
+                INSERT INTO log_rollups (hour, name, type, count)
+                SELECT substr(datetime, 1, 13), COALESCE(name, ''), COALESCE(type, ''), COUNT(*)
+                FROM logs GROUP BY 1, 2, 3
+            ''')
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def migrate_accounts(conn: sqlite3.Connection) -> None:
+    """
+    Bring an accounts table written by an earlier version up to date: add any missing
+    columns, and convert accounts stored as one JSON blob in accounts.account into the
+    normalized columns plus the transactions and portfolio_snapshots tables.
+    Safe to run repeatedly: migrated rows have their blob cleared.
+    Columns added here start out NULL; Account.get rebuilds them from the ledger.
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(accounts)")}
+    for column, type in ACCOUNT_COLUMNS.items():
+        if column not in columns:
+            conn.execute(f"ALTER TABLE accounts ADD COLUMN {column} {type}")
+    if "account" not in columns:
+        return
+    rows = conn.execute("SELECT name, account FROM accounts WHERE account IS NOT NULL").fetchall()
+    for name, blob in rows:
+        account = json.loads(blob)
+        conn.execute(
+            "UPDATE accounts SET balance = ?, strategy = ?, holdings = ?, account = NULL WHERE name = ?",
+            (account["balance"], account["strategy"], json.dumps(account["holdings"]), name),
         )
-    ''')
-    cursor.execute('CREATE TABLE IF NOT EXISTS market (date TEXT PRIMARY KEY, data TEXT)')
-    conn.commit()
+        conn.executemany('''
+            INSERT INTO transactions (name, symbol, quantity, price, timestamp, rationale)
+            VALUES (:name, :symbol, :quantity, :price, :timestamp, :rationale)
+        ''', [{**t, "name": name} for t in account.get("transactions", [])])
+        conn.executemany(
+            "INSERT INTO portfolio_snapshots (name, timestamp, value) VALUES (?, ?, ?)",
+            [(name, timestamp, value) for timestamp, value in account.get("portfolio_value_time_series", [])],
+        )
+    if rows:
+        print(f"Migrated {len(rows)} accounts to the normalized schema")
+
+
+def rebuild_portfolio_rollups(conn: sqlite3.Connection) -> None:
+    """Recompute every portfolio value rollup from the raw snapshots."""
+    rollups = {}
+    cursor = conn.execute('SELECT name, timestamp, value FROM portfolio_snapshots ORDER BY name, timestamp, id')
+    for name, timestamp, value in cursor:
+        for resolution, length in ROLLUP_PREFIX_LENGTHS.items():
+            key = (name, resolution, timestamp[:length])
+            if key in rollups:
+                first, high, low, _, count = rollups[key]
+                rollups[key] = (first, max(high, value), min(low, value), value, count + 1)
+            else:
+                rollups[key] = (value, value, value, value, 1)
+    conn.execute('DELETE FROM portfolio_rollups')
+    conn.executemany(
+        'INSERT INTO portfolio_rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        [(*key, *values) for key, values in rollups.items()],
+    )
+
 
 def write_account(name, account_dict):
-    json_data = json.dumps(account_dict)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO accounts (name, account)
-            VALUES (?, ?)
-            ON CONFLICT(name) DO UPDATE SET account=excluded.account
-        ''', (name.lower(), json_data))
-        conn.commit()
+    """Write the current state of an account: balance, strategy, holdings and running aggregates."""
+    values = [
+        json.dumps(account_dict.get(column)) if column in JSON_ACCOUNT_COLUMNS else account_dict.get(column)
+        for column in ACCOUNT_COLUMNS
+    ]
+    columns = ", ".join(ACCOUNT_COLUMNS)
+    placeholders = ", ".join("?" for _ in ACCOUNT_COLUMNS)
+    updates = ", ".join(f"{column}=excluded.{column}" for column in ACCOUNT_COLUMNS)
+    with transaction() as conn:
+        conn.execute(f'''
+            INSERT INTO accounts (name, {columns})
+            VALUES (?, {placeholders})
+            ON CONFLICT(name) DO UPDATE SET {updates}
+        ''', (name.lower(), *values))
 
 def read_account(name):
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT account FROM accounts WHERE name = ?', (name.lower(),))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
-    
+    """Read the current state of an account, without its transaction or portfolio value history."""
+    cursor = get_connection().execute(
+        f'SELECT name, {", ".join(ACCOUNT_COLUMNS)} FROM accounts WHERE name = ?', (name.lower(),)
+    )
+    row = cursor.fetchone()
+    if not row:
+        return None
+    account = {"name": row[0]}
+    for column, value in zip(ACCOUNT_COLUMNS, row[1:]):
+        account[column] = json.loads(value) if column in JSON_ACCOUNT_COLUMNS and value is not None else value
+    return account
+
+def write_trades(name: str, account_dict: dict, transactions: list[dict]) -> None:
+    """Append transactions to the ledger and write the resulting account state atomically."""
+    with transaction() as conn:
+        conn.executemany('''
+            INSERT INTO transactions (name, symbol, quantity, price, timestamp, rationale)
+            VALUES (:name, :symbol, :quantity, :price, :timestamp, :rationale)
+        ''', [{**t, "name": name.lower()} for t in transactions])
+        write_account(name, account_dict)
+
+def read_transactions(name: str, last_n: int | None = None) -> list[dict]:
+    """
+    Read an account's transactions in chronological order.
+
+    Args:
+        name (str): The account name
+        last_n (int): If given, only the most recent last_n transactions
+    """
+    cursor = get_connection().execute('''
+        SELECT symbol, quantity, price, timestamp, rationale FROM transactions
+        WHERE name = ?
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    ''', (name.lower(), -1 if last_n is None else last_n))
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in reversed(cursor.fetchall())]
+
+def read_transactions_page(name: str, before: int | None = None, limit: int = 50) -> list[dict]:
+    """
+    Read a page of an account's transactions, newest first, using the (name, id) index.
+    Ids increase as transactions are appended, so the smallest id on a page is the cursor for the next.
+
+    Args:
+        name (str): The account name
+        before (int): If given, only transactions with an id below this cursor
+        limit (int): The maximum number of transactions to return
+    """
+    cursor = get_connection().execute('''
+        SELECT id, symbol, quantity, price, timestamp, rationale FROM transactions
+        WHERE name = ? AND id < ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (name.lower(), 2**63 - 1 if before is None else before, limit))
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def count_transactions(name: str) -> int:
+    row = get_connection().execute("SELECT COUNT(*) FROM transactions WHERE name = ?", (name.lower(),)).fetchone()
+    return row[0]
+
+def latest_transaction_id(name: str) -> int:
+    """The id of the account's most recent transaction, or 0; it changes whenever a trade is recorded."""
+    row = get_connection().execute("SELECT MAX(id) FROM transactions WHERE name = ?", (name.lower(),)).fetchone()
+    return row[0] or 0
+
+def transaction_stats(name: str) -> dict:
+    """Aggregate statistics over an account's whole ledger, computed in the database."""
+    cursor = get_connection().execute('''
+        SELECT
+            COUNT(*) AS trades,
+            COALESCE(SUM(quantity > 0), 0) AS buys,
+            COALESCE(SUM(quantity < 0), 0) AS sells,
+            COALESCE(SUM(CASE WHEN quantity > 0 THEN quantity * price END), 0.0) AS bought_value,
+            COALESCE(SUM(CASE WHEN quantity < 0 THEN -quantity * price END), 0.0) AS sold_value,
+            COUNT(DISTINCT symbol) AS symbols_traded,
+            MIN(timestamp) AS first_trade,
+            MAX(timestamp) AS last_trade
+        FROM transactions WHERE name = ?
+    ''', (name.lower(),))
+    columns = [column[0] for column in cursor.description]
+    return dict(zip(columns, cursor.fetchone()))
+
+def write_portfolio_value(name: str, timestamp: str, value: float) -> None:
+    """Append a portfolio value snapshot and fold it into each rollup resolution."""
+    with transaction() as conn:
+        conn.execute(
+            "INSERT INTO portfolio_snapshots (name, timestamp, value) VALUES (?, ?, ?)",
+            (name.lower(), timestamp, value),
+        )
+        conn.executemany('''
+            INSERT INTO portfolio_rollups (name, resolution, bucket, open, high, low, close, count)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+            ON CONFLICT(name, resolution, bucket) DO UPDATE SET
+                high=max(high, excluded.high), low=min(low, excluded.low), close=excluded.close, count=count+1
+        ''', [
+            (name.lower(), resolution, timestamp[:length], value, value, value, value)
+            for resolution, length in ROLLUP_PREFIX_LENGTHS.items()
+        ])
+
+def read_portfolio_values(name: str, start: str | None = None, end: str | None = None) -> list[tuple[str, float]]:
+    """Raw portfolio value snapshots as (timestamp, value), optionally limited to start <= timestamp <= end."""
+    cursor = get_connection().execute(
+        '''
+        SELECT timestamp, value FROM portfolio_snapshots
+        WHERE name = ? AND timestamp >= ? AND timestamp <= ?
+        ORDER BY timestamp, id
+        ''',
+        (name.lower(), start or "", end or "9999"),
+    )
+    return cursor.fetchall()
+
+def read_portfolio_rollups(name: str, resolution: str, start: str | None = None, end: str | None = None) -> list[tuple]:
+    """Rollup buckets as (bucket, open, high, low, close) for buckets overlapping start to end."""
+    length = ROLLUP_PREFIX_LENGTHS[resolution]
+    cursor = get_connection().execute(
+        '''
+        SELECT bucket, open, high, low, close FROM portfolio_rollups
+        WHERE name = ? AND resolution = ? AND bucket >= ? AND bucket <= ?
+        ORDER BY bucket
+        ''',
+        (name.lower(), resolution, (start or "")[:length], (end or "9999")[:length]),
+    )
+    return cursor.fetchall()
+
+def portfolio_value_range(name: str) -> tuple[str, str] | tuple[None, None]:
+    """The first and last snapshot timestamps for an account."""
+    return get_connection().execute(
+        "SELECT MIN(timestamp), MAX(timestamp) FROM portfolio_snapshots WHERE name = ?", (name.lower(),)
+    ).fetchone()
+
+def read_leaderboard() -> list[dict]:
+    """
+    Every account with its latest recorded portfolio value and profit or loss, best first.
+    The latest value comes from the (name, timestamp) index, so the cost is per account, not per snapshot.
+    """
+    cursor = get_connection().execute('''
+        SELECT name, balance, value, value - net_invested - balance AS profit_loss, updated FROM (
+            SELECT
+                accounts.name, accounts.balance, COALESCE(accounts.net_invested, 0.0) AS net_invested,
+                (SELECT value FROM portfolio_snapshots
+                 WHERE portfolio_snapshots.name = accounts.name ORDER BY timestamp DESC LIMIT 1) AS value,
+                (SELECT timestamp FROM portfolio_snapshots
+                 WHERE portfolio_snapshots.name = accounts.name ORDER BY timestamp DESC LIMIT 1) AS updated
+            FROM accounts
+        )
+        WHERE value IS NOT NULL
+        ORDER BY value DESC
+    ''')
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def clear_account_history(name: str) -> None:
+    """Delete an account's transactions and portfolio value history."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM transactions WHERE name = ?", (name.lower(),))
+        conn.execute("DELETE FROM portfolio_snapshots WHERE name = ?", (name.lower(),))
+        conn.execute("DELETE FROM portfolio_rollups WHERE name = ?", (name.lower(),))
+
+def write_logs(entries: list[tuple[str, str, str, str]]) -> None:
+    """
+    Insert a batch of log entries, and add them to the hourly rollups, in one transaction.
+
+    Args:
+        entries (list): Tuples of (name, datetime, type, message)
+    """
+    counts = {}
+    for name, timestamp, type, _ in entries:
+        key = (timestamp[:13], name or "", type or "")
+        counts[key] = counts.get(key, 0) + 1
+    with transaction() as conn:
+        conn.executemany('''
+            INSERT INTO logs (name, datetime, type, message)
+            VALUES (?, ?, ?, ?)
+        ''', entries)
+        conn.executemany('''
+            INSERT INTO log_rollups (hour, name, type, count) VALUES (?, ?, ?, ?)
+            ON CONFLICT(hour, name, type) DO UPDATE SET count = count + excluded.count
+        ''', [(*key, count) for key, count in counts.items()])
+
+
+class BatchWriter:
+    """
+    Buffers records in memory and writes them with the sink function from a background thread,
+    whenever LOG_FLUSH_SIZE records are waiting or LOG_FLUSH_INTERVAL seconds have passed.
+    Writers block once LOG_BUFFER_CAPACITY records are waiting, so a stalled disk slows
+    callers down instead of growing memory without limit.
+    """
+
+    def __init__(
+        self, sink, capacity=LOG_BUFFER_CAPACITY, flush_size=LOG_FLUSH_SIZE, flush_interval=LOG_FLUSH_INTERVAL
+    ):
+        self.sink = sink
+        self.capacity = capacity
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._buffer = deque()
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+
+    def append(self, record) -> None:
+        with self._condition:
+            self._ensure_running()
+            while len(self._buffer) >= self.capacity:
+                self._condition.wait()
+            self._buffer.append(record)
+            if len(self._buffer) >= self.flush_size:
+                self._condition.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Wait until every buffered entry has been written. Returns False on timeout."""
+        with self._condition:
+            if not self._buffer and not self._in_flight:
+                return True
+            self._ensure_running()
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: not self._buffer and not self._in_flight, timeout)
+
+    def shutdown(self, timeout: float | None = None) -> None:
+        """Drain the buffer and stop the background thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread:
+            thread.join(timeout)
+        if self._buffer:
+            self._write_batch()
+
+    def _ensure_running(self) -> None:
+        # Called with the condition held; restarts the thread after a fork or a shutdown
+        if self._thread and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        self._closed = False
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name=f"{self.sink.__name__}-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._closed or len(self._buffer) >= self.flush_size, self.flush_interval
+                )
+                if self._closed and not self._buffer:
+                    return
+            self._write_batch()
+
+    def after_batch(self) -> None:
+        """Runs on the writer thread after each batch; flush() waits for it to finish too."""
+        pass
+
+    def _write_batch(self) -> None:
+        with self._condition:
+            batch = list(self._buffer)
+            self._buffer.clear()
+            self._in_flight = len(batch) or 1
+            self._condition.notify_all()
+        try:
+            if batch:
+                self.sink(batch)
+            self.after_batch()
+        except Exception as e:
+            print(f"Failed to write {len(batch)} records with {self.sink.__name__}: {e}")
+        finally:
+            with self._condition:
+                self._in_flight = 0
+                self._condition.notify_all()
+
+
+class LogWriter(BatchWriter):
+    """
+    The batch writer for log entries. Its thread also applies the retention policy with
+    compact_logs every LOG_COMPACT_INTERVAL seconds, first one interval after startup, so the
+    many processes that each own a writer don't all compact the same file as they start.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(write_logs, **kwargs)
+        self._compacted_at = time.monotonic()
+
+    def write(self, name: str, type: str, message: str) -> None:
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        self.append((name.lower(), timestamp, type, message))
+
+    def after_batch(self) -> None:
+        if time.monotonic() - self._compacted_at < LOG_COMPACT_INTERVAL:
+            return
+        self._compacted_at = time.monotonic()
+        try:
+            compact_logs()
+        except Exception as e:
+            print(f"Failed to compact the logs: {e}")
+
+
+log_writer = LogWriter()
+atexit.register(log_writer.shutdown)
+
+
 def write_log(name: str, type: str, message: str):
     """
-    Write a log entry to the logs table.
-    
+    Write a log entry to the logs table. The entry is buffered and written shortly
+    afterwards by the background log writer; call log_writer.flush() to wait for it.
+
     Args:
         name (str): The name associated with the log
         type (str): The type of log entry
         message (str): The log message
     """
-    now = datetime.now().isoformat()
-    
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO logs (name, datetime, type, message)
-            VALUES (?, datetime('now'), ?, ?)
-        ''', (name.lower(), type, message))
-        conn.commit()
+    log_writer.write(name, type, message)
+
+SPAN_COLUMNS = (
+    "span_id", "trace_id", "parent_id", "name", "type", "label", "server", "model", "started_at",
+    "start_monotonic", "end_monotonic", "duration_ms", "error", "input_tokens", "output_tokens",
+)
+
+def write_spans(spans: list[dict]) -> None:
+    """Insert a batch of finished span records."""
+    with transaction() as conn:
+        conn.executemany(
+            f'INSERT OR REPLACE INTO spans ({", ".join(SPAN_COLUMNS)}) VALUES ({", ".join("?" for _ in SPAN_COLUMNS)})',
+            [tuple(span.get(column) for column in SPAN_COLUMNS) for span in spans],
+        )
+
+
+span_writer = BatchWriter(write_spans)
+atexit.register(span_writer.shutdown)
+
+
+def write_span(span: dict) -> None:
+    """Buffer a finished span record with the keys in SPAN_COLUMNS; it's written shortly afterwards."""
+    span_writer.append(span)
+
+def percentile(ordered: list[float], fraction: float) -> float:
+    """The nearest-rank percentile of an ascending list."""
+    return ordered[max(0, math.ceil(len(ordered) * fraction) - 1)] if ordered else 0.0
+
+# How read_span_latencies can group spans: by span type, by model for model calls,
+# or by tool (prefixed with its MCP server, if any) for function calls
+SPAN_GROUPS = {
+    "type": ("type", ""),
+    "model": ("model", "AND model IS NOT NULL"),
+    "tool": ("COALESCE(server || '.', '') || label", "AND type = 'function'"),
+}
+
+def read_span_latencies(group_by: str = "type", since: str | None = None, name: str | None = None) -> list[dict]:
+    """
+    Latency percentiles, error counts and token usage of finished spans, per group, slowest p95 first.
+
+    Args:
+        group_by (str): "type", "model" or "tool"
+        since (str): Only spans started at or after this UTC "%Y-%m-%d %H:%M:%S" time
+        name (str): Only this trader's spans
+    """
+    expression, condition = SPAN_GROUPS[group_by]
+    parameters = [complete_timestamp(since or "0000")]
+    if name is not None:
+        condition += " AND name = ?"
+        parameters.append(name.lower())
+    cursor = get_connection().execute(f'''
+        SELECT {expression}, duration_ms, error IS NOT NULL, COALESCE(input_tokens, 0), COALESCE(output_tokens, 0)
+        FROM spans
+        WHERE started_at >= ? {condition}
+        ORDER BY 1, duration_ms
+    ''', parameters)
+    groups = {}
+    for group, duration, failed, input_tokens, output_tokens in cursor:
+        stats = groups.setdefault(group, {"durations": [], "errors": 0, "input_tokens": 0, "output_tokens": 0})
+        stats["durations"].append(duration)
+        stats["errors"] += failed
+        stats["input_tokens"] += input_tokens
+        stats["output_tokens"] += output_tokens
+    rows = [
+        {
+            group_by: group,
+            "count": len(stats["durations"]),
+            "p50_ms": percentile(stats["durations"], 0.50),
+            "p95_ms": percentile(stats["durations"], 0.95),
+            "p99_ms": percentile(stats["durations"], 0.99),
+            "errors": stats["errors"],
+            "input_tokens": stats["input_tokens"],
+            "output_tokens": stats["output_tokens"],
+        }
+        for group, stats in groups.items()
+    ]
+    return sorted(rows, key=lambda row: row["p95_ms"], reverse=True)
 
 def read_log(name: str, last_n=10):
     """
     Read the most recent log entries for a given name.
-    
+
     Args:
         name (str): The name to retrieve logs for
         last_n (int): Number of most recent entries to retrieve
-        
+
     Returns:
         list: A list of tuples containing (datetime, type, message)
     """
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT datetime, type, message FROM logs 
-            WHERE name = ? 
-            ORDER BY datetime DESC
-            LIMIT ?
-        ''', (name.lower(), last_n))
-        
-        return reversed(cursor.fetchall())
+    cursor = get_connection().execute('''
+        SELECT datetime, type, message FROM logs
+        WHERE name = ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (name.lower(), last_n))
+    return reversed(cursor.fetchall())
+
+def read_logs_after(last_id: int, limit: int = 1000) -> list[tuple]:
+    """
+    Read log entries for every name written after a given log id, oldest first.
+
+    Returns:
+        list: A list of tuples containing (id, name, datetime, type, message)
+    """
+    cursor = get_connection().execute('''
+        SELECT id, name, datetime, type, message FROM logs
+        WHERE id > ?
+        ORDER BY id
+        LIMIT ?
+    ''', (last_id, limit))
+    return cursor.fetchall()
+
+def read_recent_logs(name: str, last_n: int, up_to_id: int) -> list[tuple]:
+    """The last_n entries for a name with ids up to up_to_id, as (id, datetime, type, message), oldest first."""
+    cursor = get_connection().execute('''
+        SELECT id, datetime, type, message FROM logs
+        WHERE name = ? AND id <= ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (name.lower(), up_to_id, last_n))
+    return list(reversed(cursor.fetchall()))
+
+def complete_timestamp(prefix: str) -> str:
+    """Extend a prefix such as "2025-06" to a full "%Y-%m-%d %H:%M:%S" timestamp at the start of that period."""
+    return prefix + "0000-01-01 00:00:00"[len(prefix):]
+
+def query_logs(
+    name: str | None = None,
+    type: str | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    before: int | None = None,
+    limit: int = 100,
+) -> list[dict]:
+    """
+    Log entries matching every given filter, newest first. Page backwards by passing the
+    smallest id of one page as the before cursor of the next.
+
+    Args:
+        name (str): Only this trader's entries
+        type (str): Only entries of this type, such as "trace", "span", "account" or "function"
+        start (str): Only entries at or after this UTC "%Y-%m-%d %H:%M:%S" time (or a prefix of one)
+        end (str): Only entries before this UTC time
+        before (int): Only entries with an id below this cursor
+        limit (int): The maximum number of entries to return
+    """
+    conditions, parameters = [], []
+    for column, value in (("name", name.lower() if name else None), ("type", type)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            parameters.append(value)
+    # The datetime column has numeric affinity, so a bare year like "2025" would compare as a number
+    if start is not None:
+        conditions.append("datetime >= ?")
+        parameters.append(complete_timestamp(start))
+    if end is not None:
+        conditions.append("datetime < ?")
+        parameters.append(complete_timestamp(end))
+    if before is not None:
+        conditions.append("id < ?")
+        parameters.append(before)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    cursor = get_connection().execute(
+        f'SELECT id, name, datetime, type, message FROM logs {where} ORDER BY id DESC LIMIT ?',
+        (*parameters, limit),
+    )
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def read_log_rollups(name: str | None = None, start: str | None = None, end: str | None = None) -> list[dict]:
+    """Hourly counts of log entries per name and type, oldest first; start and end compare against "%Y-%m-%d %H"."""
+    conditions, parameters = [], []
+    if name is not None:
+        conditions.append("name = ?")
+        parameters.append(name.lower())
+    if start is not None:
+        conditions.append("hour >= ?")
+        parameters.append(start[:13])
+    if end is not None:
+        conditions.append("hour < ?")
+        parameters.append(end[:13])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    cursor = get_connection().execute(
+        f'SELECT hour, name, type, count FROM log_rollups {where} ORDER BY hour, name, type', parameters
+    )
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def compact_logs(retention_days: float = LOG_RETENTION_DAYS, batch_size: int = 10_000) -> int:
+    """
+    Delete log entries and spans older than the retention period, a batch at a time so writers
+    aren't held up for long; the hourly rollups are kept. Returns the number of log entries deleted.
+    """
+    if retention_days <= 0:
+        return 0
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).strftime("%Y-%m-%d %H:%M:%S")
+    deleted = 0
+    while True:
+        with transaction() as conn:
+            cursor = conn.execute('''
+                DELETE FROM logs WHERE id IN (
+                    SELECT id FROM logs WHERE datetime < ? ORDER BY datetime LIMIT ?
+                )
+            ''', (cutoff, batch_size))
+        deleted += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            break
+    with transaction() as conn:
+        conn.execute("DELETE FROM spans WHERE started_at < ?", (cutoff,))
+    if deleted:
+        get_connection().execute("PRAGMA optimize")
+    return deleted
+
+def latest_log_id() -> int:
+    return get_connection().execute('SELECT COALESCE(MAX(id), 0) FROM logs').fetchone()[0]
+
+def data_version() -> int:
+    """Changes whenever another connection commits to the database, so pollers can skip queries when idle."""
+    return get_connection().execute('PRAGMA data_version').fetchone()[0]
 
 def write_market(date: str, data: dict) -> None:
     data_json = json.dumps(data)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
+    with transaction() as conn:
+        conn.execute('''
             INSERT INTO market (date, data)
             VALUES (?, ?)
             ON CONFLICT(date) DO UPDATE SET data=excluded.data
         ''', (date, data_json))
-        conn.commit()
 
 def read_market(date: str) -> dict | None:
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT data FROM market WHERE date = ?', (date,))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
\ No newline at end of file
+    cursor = get_connection().execute('SELECT data FROM market WHERE date = ?', (date,))
+    row = cursor.fetchone()
+    return json.loads(row[0]) if row else None
+
+def list_market_dates() -> list[str]:
+    cursor = get_connection().execute('SELECT date FROM market ORDER BY date')
+    return [row[0] for row in cursor.fetchall()]
+
+def delete_market(date: str) -> None:
+    with transaction() as conn:
+        conn.execute('DELETE FROM market WHERE date = ?', (date,))
+
+def write_prices(prices: dict[str, float], fetched_at: float) -> None:
+    """Share prices fetched from upstream, stamped with the epoch time they were fetched."""
+    with transaction() as conn:
+        conn.executemany('''
+            INSERT INTO prices (symbol, price, fetched_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT(symbol) DO UPDATE SET price=excluded.price, fetched_at=excluded.fetched_at
+        ''', [(symbol, price, fetched_at) for symbol, price in prices.items()])
+
+def read_prices(symbols: list[str]) -> dict[str, tuple[float, float]]:
+    """Cached share prices as a dict of symbol to (price, fetched_at)."""
+    if not symbols:
+        return {}
+    placeholders = ", ".join("?" for _ in symbols)
+    cursor = get_connection().execute(
+        f'SELECT symbol, price, fetched_at FROM prices WHERE symbol IN ({placeholders})', list(symbols)
+    )
+    return {symbol: (price, fetched_at) for symbol, price, fetched_at in cursor.fetchall()}
+
+def write_llm_response(key: str, model: str, request: str, response: str) -> None:
+    """Record a model response under the hash of its request."""
+    with transaction() as conn:
+        conn.execute('''
+            INSERT INTO llm_cache (key, model, request, response, recorded_at) VALUES (?, ?, ?, ?, datetime('now'))
+            ON CONFLICT(key) DO UPDATE SET response=excluded.response, recorded_at=excluded.recorded_at
+        ''', (key, model, request, response))
+
+def read_llm_response(key: str) -> str | None:
+    row = get_connection().execute("SELECT response FROM llm_cache WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def write_cycle_metrics(metrics: list[dict]) -> None:
+    """Insert a batch of scheduler run records."""
+    with transaction() as conn:
+        conn.executemany('''
+            INSERT INTO cycle_metrics (
+                cycle, name, provider, scheduled_at, started_at, finished_at, wait_seconds, run_seconds, status,
+                input_tokens, output_tokens, cost
+            )
+            VALUES (
+                :cycle, :name, :provider, :scheduled_at, :started_at, :finished_at, :wait_seconds, :run_seconds, :status,
+                :input_tokens, :output_tokens, :cost
+            )
+        ''', [{"input_tokens": None, "output_tokens": None, "cost": None, **metric} for metric in metrics])
+
+
+cycle_metric_writer = BatchWriter(write_cycle_metrics)
+atexit.register(cycle_metric_writer.shutdown)
+
+
+def write_cycle_metric(metric: dict) -> None:
+    """
+    Record how one trader's run in a scheduler cycle went. The record is buffered and written
+    shortly afterwards by a background thread, so the scheduler's event loop never waits on a write lock.
+    """
+    cycle_metric_writer.append(metric)
+
+def read_cycle_metrics(last_n: int = 100) -> list[dict]:
+    """The most recent scheduler run records, oldest first."""
+    cursor = get_connection().execute('''
+        SELECT cycle, name, provider, scheduled_at, started_at, finished_at, wait_seconds, run_seconds, status,
+            input_tokens, output_tokens, cost
+        FROM cycle_metrics ORDER BY id DESC LIMIT ?
+    ''', (last_n,))
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in reversed(cursor.fetchall())]
+
+def write_run_costs(runs: list[dict]) -> None:
+    """Insert a batch of trader run costs."""
+    with transaction() as conn:
+        conn.executemany('''
+            INSERT INTO run_costs (name, trace_id, model, started_at, requests, input_tokens, output_tokens, cost, status)
+            VALUES (:name, :trace_id, :model, :started_at, :requests, :input_tokens, :output_tokens, :cost, :status)
+        ''', [{**run, "name": run["name"].lower()} for run in runs])
+
+
+run_cost_writer = BatchWriter(write_run_costs)
+atexit.register(run_cost_writer.shutdown)
+
+
+def write_run_cost(run: dict) -> None:
+    """Record the token usage and cost of one trader run; like write_cycle_metric, it's buffered."""
+    run_cost_writer.append(run)
+
+def read_spent_since(name: str, since: str) -> float:
+    """What a trader's runs have cost since a UTC "%Y-%m-%d %H:%M:%S" time."""
+    row = get_connection().execute(
+        "SELECT COALESCE(SUM(cost), 0.0) FROM run_costs WHERE name = ? AND started_at >= ?",
+        (name.lower(), since),
+    ).fetchone()
+    return row[0]
+
+def read_trader_costs() -> list[dict]:
+    """Every trader's run count, token usage and cost to date, per model it has run with."""
+    cursor = get_connection().execute('''
+        SELECT name, model, COUNT(*) AS runs, SUM(input_tokens) AS input_tokens, SUM(output_tokens) AS output_tokens,
+            SUM(cost) AS cost, SUM(status = 'over budget') AS over_budget
+        FROM run_costs GROUP BY name, model
+    ''')
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
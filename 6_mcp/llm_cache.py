@@ -0,0 +1,86 @@
+"""
+A content-addressed cache of chat completion responses, for reproducing trader runs offline.
+
+LLM_CACHE selects the mode:
+    passthrough   every call goes to the provider and nothing is stored (the default)
+    record        every call goes to the provider and the response is stored
+    replay        responses come from the store only; a request that was never recorded raises CacheMiss
+
+Responses are keyed by a hash of the provider's base URL and the request body: model, messages,
+tools and sampling settings. Headers, metadata and other request plumbing don't affect the key.
+A replay only hits while the conversation is identical, so tools whose results vary between runs,
+such as live share prices, should be replayed against a seeded market simulator with a fixed clock.
+"""
+
+import hashlib
+import json
+import os
+from collections import Counter
+from types import SimpleNamespace
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, NotGiven
+from openai.types.chat import ChatCompletion
+from database import write_llm_response, read_llm_response
+
+load_dotenv(override=True)
+
+LLM_CACHE_MODES = ("passthrough", "record", "replay")
+LLM_CACHE_MODE = os.getenv("LLM_CACHE", "passthrough").strip().lower()
+
+# Request arguments that don't change the response
+IGNORED_ARGUMENTS = {"extra_headers", "extra_query", "metadata", "store", "stream_options", "timeout"}
+
+stats = Counter()
+
+
+class CacheMiss(LookupError):
+    pass
+
+
+def request_key(base_url: str, arguments: dict) -> tuple[str, str]:
+    """The canonical JSON of a request and its SHA-256 key."""
+    request = {
+        name: value
+        for name, value in arguments.items()
+        if name not in IGNORED_ARGUMENTS and value is not None and not isinstance(value, NotGiven)
+    }
+    canonical = json.dumps({"base_url": base_url, **request}, sort_keys=True, default=str)
+    return canonical, hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class CachedCompletions:
+    def __init__(self, client: AsyncOpenAI, mode: str):
+        self._client = client
+        self.mode = mode
+
+    async def create(self, **arguments):
+        if self.mode == "passthrough" or arguments.get("stream"):
+            return await self._client.chat.completions.create(**arguments)
+        request, key = request_key(str(self._client.base_url), arguments)
+        recorded = read_llm_response(key)
+        if recorded is not None:
+            stats["hits"] += 1
+            return ChatCompletion.model_validate_json(recorded)
+        stats["misses"] += 1
+        if self.mode == "replay":
+            raise CacheMiss(f"No recorded response for this {arguments.get('model')} request (key {key[:12]})")
+        response = await self._client.chat.completions.create(**arguments)
+        write_llm_response(key, arguments.get("model"), request, response.model_dump_json())
+        return response
+
+
+class CachingClient:
+    """Wraps an AsyncOpenAI client so chat completions go through the cache; everything else is delegated."""
+
+    def __init__(self, client: AsyncOpenAI, mode: str = LLM_CACHE_MODE):
+        if mode not in LLM_CACHE_MODES:
+            raise ValueError(f"LLM_CACHE must be one of {', '.join(LLM_CACHE_MODES)}, not {mode!r}")
+        self._client = client
+        self.chat = SimpleNamespace(completions=CachedCompletions(client, mode))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def cached_client(client: AsyncOpenAI) -> AsyncOpenAI:
+    return client if LLM_CACHE_MODE == "passthrough" else CachingClient(client)
@@ -1,30 +1,55 @@
-from polygon import RESTClient
 from dotenv import load_dotenv
 import os
 from datetime import datetime
-import random
-from database import write_market, read_market
+import market_simulator
+from bisect import bisect_right
+from market_snapshot import MarketSnapshot, open_snapshot, write_snapshot, snapshot_dates
+from price_cache import PriceCache
 from functools import lru_cache
 from datetime import timezone
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from polygon import RESTClient
 
 load_dotenv(override=True)
 
 polygon_api_key = os.getenv("POLYGON_API_KEY")
 polygon_plan = os.getenv("POLYGON_PLAN")
 
+# Without a Polygon key, or when MARKET_SIMULATION is set, prices come from the offline simulator
+use_simulator = bool(os.getenv("MARKET_SIMULATION")) or not polygon_api_key
+
 is_paid_polygon = polygon_plan == "paid"
 is_realtime_polygon = polygon_plan == "realtime"
 
+# Seconds a cached price stays fresh on each plan; PRICE_CACHE_TTL overrides the default.
+# Past that, a price is still served for as long again while it is refreshed in the background.
+PRICE_CACHE_TTL_SECONDS = {"eod": 3600.0, "paid": 60.0, "realtime": 5.0}
+price_cache_plan = "realtime" if is_realtime_polygon else "paid" if is_paid_polygon else "eod"
+price_cache_ttl = float(os.getenv("PRICE_CACHE_TTL", PRICE_CACHE_TTL_SECONDS[price_cache_plan]))
+price_cache = PriceCache(ttl=price_cache_ttl, max_stale=price_cache_ttl)
+
+
+@lru_cache(maxsize=1)
+def get_client() -> "RESTClient":
+    # Imported here as it's slow to import and the simulator doesn't need it
+    from polygon import RESTClient
+
+    return RESTClient(polygon_api_key)
+
 
 def is_market_open() -> bool:
-    client = RESTClient(polygon_api_key)
+    if use_simulator:
+        return market_simulator.is_market_open()
+    client = get_client()
     market_status = client.get_market_status()
     return market_status.market == "open"
 
 
 def get_all_share_prices_polygon_eod() -> dict[str, float]:
     """With much thanks to student Reema R. for fixing the timezone issue with this!"""
-    client = RESTClient(polygon_api_key)
+    client = get_client()
 
     probe = client.get_previous_close_agg("SPY")[0]
     last_close = datetime.fromtimestamp(probe.timestamp / 1000, tz=timezone.utc).date()
@@ -34,12 +59,22 @@ def get_all_share_prices_polygon_eod() -> dict[str, float]:
 
 
 @lru_cache(maxsize=2)
-def get_market_for_prior_date(today):
-    market_data = read_market(today)
-    if not market_data:
-        market_data = get_all_share_prices_polygon_eod()
-        write_market(today, market_data)
-    return market_data
+def get_market_for_prior_date(today) -> MarketSnapshot:
+    snapshot = open_snapshot(today)
+    if snapshot is None:
+        write_snapshot(today, get_all_share_prices_polygon_eod())
+        open_snapshot.cache_clear()
+        snapshot = open_snapshot(today)
+    return snapshot
+
+
+def get_share_price_on(symbol, date: str) -> float:
+    """The closing price from the latest snapshot taken on or before the given YYYY-MM-DD date"""
+    dates = snapshot_dates()
+    index = bisect_right(dates, date)
+    if index == 0:
+        return 0.0
+    return open_snapshot(dates[index - 1]).get(symbol, 0.0)
 
 
 def get_share_price_polygon_eod(symbol) -> float:
@@ -48,23 +83,67 @@ def get_share_price_polygon_eod(symbol) -> float:
     return market_data.get(symbol, 0.0)
 
 
+def get_share_prices_polygon_eod(symbols: list[str]) -> dict[str, float]:
+    today = datetime.now().date().strftime("%Y-%m-%d")
+    market_data = get_market_for_prior_date(today)
+    return {symbol: market_data.get(symbol, 0.0) for symbol in symbols}
+
+
 def get_share_price_polygon_min(symbol) -> float:
-    client = RESTClient(polygon_api_key)
+    client = get_client()
     result = client.get_snapshot_ticker("stocks", symbol)
     return result.min.close or result.prev_day.close
 
 
-def get_share_price_polygon(symbol) -> float:
-    if is_paid_polygon:
-        return get_share_price_polygon_min(symbol)
+def get_share_prices_polygon_min(symbols: list[str]) -> dict[str, float]:
+    """One snapshot request for every symbol; symbols Polygon doesn't recognize are priced at 0"""
+    client = get_client()
+    results = client.get_snapshot_all("stocks", tickers=symbols)
+    prices = {symbol: 0.0 for symbol in symbols}
+    for result in results:
+        prices[result.ticker] = result.min.close or result.prev_day.close
+    return prices
+
+
+def fetch_share_prices_polygon(symbols: list[str]) -> dict[str, float]:
+    if not is_paid_polygon:
+        return get_share_prices_polygon_eod(symbols)
+    elif len(symbols) == 1:
+        return {symbols[0]: get_share_price_polygon_min(symbols[0])}
     else:
-        return get_share_price_polygon_eod(symbol)
+        return get_share_prices_polygon_min(symbols)
+
+
+def get_share_price_polygon(symbol) -> float:
+    return get_share_prices_polygon([symbol])[symbol]
+
+
+def get_share_prices_polygon(symbols: list[str]) -> dict[str, float]:
+    return price_cache.get_many(symbols, fetch_share_prices_polygon)
 
 
 def get_share_price(symbol) -> float:
-    if polygon_api_key:
+    if not use_simulator:
         try:
             return get_share_price_polygon(symbol)
         except Exception as e:
-            print(f"Was not able to use the polygon API due to {e}; using a random number")
-    return float(random.randint(1, 100))
+            print(f"Was not able to use the polygon API due to {e}; using the market simulator")
+    return market_simulator.get_share_price(symbol)
+
+
+def get_share_prices(symbols) -> dict[str, float]:
+    """Price several symbols with a single upstream round-trip"""
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return {}
+    if not use_simulator:
+        try:
+            return get_share_prices_polygon(symbols)
+        except Exception as e:
+            print(f"Was not able to use the polygon API due to {e}; using the market simulator")
+    return market_simulator.get_share_prices(symbols)
+
+
+def market_time() -> datetime:
+    """The current time on the market's clock, which is simulated when prices are"""
+    return market_simulator.clock.now() if use_simulator else datetime.now()
@@ -1,9 +1,6 @@
 from mcp.server.fastmcp import FastMCP
-from market import get_share_price
+from market import get_share_price, get_share_prices, is_market_open, market_time
 
-mcp = FastMCP("market_server")
-
-@mcp.tool()
 async def lookup_share_price(symbol: str) -> float:
     """This tool provides the current price of the given stock symbol.
 
@@ -12,5 +9,27 @@ async def lookup_share_price(symbol: str) -> float:
     """
     return get_share_price(symbol)
 
+async def lookup_share_prices(symbols: list[str]) -> dict[str, float]:
+    """This tool provides the current prices of several stock symbols in one call.
+    Prefer it to repeated lookup_share_price calls when you need more than one price.
+
+    Args:
+        symbols: the symbols of the stocks
+    """
+    return get_share_prices(symbols)
+
+async def get_market_status() -> dict:
+    """This tool provides the current market time and whether the market is open for trading."""
+    return {"time": market_time().strftime("%Y-%m-%d %H:%M:%S"), "open": is_market_open()}
+
+def register(mcp: FastMCP) -> None:
+    """Add the market tools to an MCP server; the trading server combines them with others."""
+    for tool in (lookup_share_price, lookup_share_prices, get_market_status):
+        mcp.tool()(tool)
+
+
+mcp = FastMCP("market_server")
+register(mcp)
+
 if __name__ == "__main__":
     mcp.run(transport='stdio')
\ No newline at end of file
@@ -0,0 +1,193 @@
+"""
+A seeded, offline stand-in for the market data API.
+
+Prices either follow a correlated geometric Brownian motion, or are replayed from a CSV file of
+bars with timestamp, symbol and close columns. Both are read against a simulated clock, so every
+process sharing the same settings sees the same price for a symbol at the same moment, and a run
+can be repeated exactly.
+
+Settings, all optional:
+    MARKET_SIMULATION        "gbm" (the default when there's no POLYGON_API_KEY) or the path to a CSV of bars
+    SIMULATION_SEED          seed for the generated prices
+    SIMULATION_CORRELATION   share of each symbol's variance driven by a common market factor
+    SIMULATION_START         the simulated time, YYYY-MM-DD HH:MM:SS, at the real time SIMULATION_EPOCH
+    SIMULATION_EPOCH         defaults to SIMULATION_START; without either, the simulated clock is the real one
+    SIMULATION_SPEED         simulated seconds per real second
+"""
+
+import csv
+import os
+import zlib
+from bisect import bisect_right
+from datetime import datetime, timedelta, date
+from functools import lru_cache
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+SIMULATION_SEED = int(os.getenv("SIMULATION_SEED", "42"))
+SIMULATION_CORRELATION = float(os.getenv("SIMULATION_CORRELATION", "0.4"))
+SIMULATION_SPEED = float(os.getenv("SIMULATION_SPEED", "1"))
+
+# Prices move once a minute through a 9:30 to 16:00 session, Monday to Friday, in exchange time
+SESSION_OPEN = timedelta(hours=9, minutes=30)
+SESSION_MINUTES = 390
+TRADING_DAYS_PER_YEAR = 252
+ORIGIN = date(2024, 1, 1)
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class SimulatedClock:
+    """Simulated time runs at speed from start, which it read at the real time epoch; tests can set it directly."""
+
+    def __init__(self, start: datetime | None = None, epoch: datetime | None = None, speed: float = 1.0):
+        self.start = start
+        self.epoch = epoch or start
+        self.speed = speed
+        self.fixed: datetime | None = None
+
+    def now(self) -> datetime:
+        if self.fixed is not None:
+            return self.fixed
+        if self.start is None:
+            return datetime.now()
+        return self.start + (datetime.now() - self.epoch) * self.speed
+
+    def set(self, moment: datetime) -> None:
+        """Stop the clock at the given time, until the next set or advance."""
+        self.fixed = moment
+
+    def advance(self, seconds: float) -> datetime:
+        self.fixed = self.now() + timedelta(seconds=seconds)
+        return self.fixed
+
+
+def is_trading_day(day: date) -> bool:
+    return day.weekday() < 5
+
+
+def is_session_open(moment: datetime) -> bool:
+    minute = (moment - datetime.combine(moment.date(), datetime.min.time()) - SESSION_OPEN) // timedelta(minutes=1)
+    return is_trading_day(moment.date()) and 0 <= minute < SESSION_MINUTES
+
+
+def trading_minute(moment: datetime) -> tuple[int, int]:
+    """
+    The trading day index since ORIGIN and the minute within that day's session, clamped to the
+    session, so prices hold still overnight and at weekends.
+    """
+    day = moment.date()
+    weeks, extra = divmod((day - ORIGIN).days, 7)
+    days = weeks * 5 + sum(is_trading_day(ORIGIN + timedelta(days=weeks * 7 + offset)) for offset in range(extra))
+    if not is_trading_day(day):
+        return days - 1, SESSION_MINUTES - 1
+    minute = (moment - datetime.combine(day, datetime.min.time()) - SESSION_OPEN) // timedelta(minutes=1)
+    if minute < 0:
+        return days - 1, SESSION_MINUTES - 1
+    return days, min(minute, SESSION_MINUTES - 1)
+
+
+def symbol_key(symbol: str) -> int:
+    return zlib.crc32(symbol.upper().encode("utf-8"))
+
+
+class GBMMarket:
+    """
+    Minute-by-minute geometric Brownian motion for any symbol. Each symbol's starting price,
+    drift and volatility are derived from its name, and its shocks combine a common market factor
+    with its own noise. Shocks are generated one trading day at a time from seeds derived from
+    (seed, day, symbol), so a price never depends on which prices were asked for before.
+    """
+
+    def __init__(self, seed: int, correlation: float):
+        self.seed = seed
+        self.correlation = correlation
+        self._day_totals: dict[str, list[float]] = {}  # cumulative log return at the end of each day
+        self._market_shocks = lru_cache(maxsize=64)(self._generate_market_shocks)
+
+    def parameters(self, symbol: str) -> tuple[float, float, float]:
+        rng = np.random.default_rng([self.seed, symbol_key(symbol)])
+        start_price = float(np.exp(rng.uniform(np.log(10), np.log(500))))
+        drift = rng.uniform(-0.05, 0.15)
+        volatility = rng.uniform(0.15, 0.6)
+        return start_price, drift, volatility
+
+    def _generate_market_shocks(self, day: int) -> np.ndarray:
+        return np.random.default_rng([self.seed, day, 0]).standard_normal(SESSION_MINUTES)
+
+    def day_returns(self, symbol: str, day: int) -> np.ndarray:
+        """The log return of each minute of a trading day."""
+        _, drift, volatility = self.parameters(symbol)
+        own = np.random.default_rng([self.seed, day, 1, symbol_key(symbol)]).standard_normal(SESSION_MINUTES)
+        shocks = np.sqrt(self.correlation) * self._market_shocks(day) + np.sqrt(1 - self.correlation) * own
+        dt = 1 / (TRADING_DAYS_PER_YEAR * SESSION_MINUTES)
+        return (drift - volatility**2 / 2) * dt + volatility * np.sqrt(dt) * shocks
+
+    def log_return_before(self, symbol: str, day: int) -> float:
+        totals = self._day_totals.setdefault(symbol, [0.0])
+        while len(totals) <= day:
+            totals.append(totals[-1] + float(self.day_returns(symbol, len(totals) - 1).sum()))
+        return totals[day]
+
+    def price(self, symbol: str, moment: datetime) -> float:
+        day, minute = trading_minute(moment)
+        if day < 0:
+            return round(self.parameters(symbol)[0], 2)
+        log_return = self.log_return_before(symbol, day) + float(self.day_returns(symbol, day)[: minute + 1].sum())
+        return round(self.parameters(symbol)[0] * float(np.exp(log_return)), 2)
+
+
+class CSVMarket:
+    """Replays closing prices from a CSV of bars; a symbol's price is its latest close at or before the time."""
+
+    def __init__(self, path: str):
+        bars: dict[str, list[tuple[str, float]]] = {}
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                bars.setdefault(row["symbol"].upper(), []).append((row["timestamp"], float(row["close"])))
+        self._times, self._closes = {}, {}
+        for symbol, rows in bars.items():
+            rows.sort()
+            self._times[symbol] = [timestamp for timestamp, _ in rows]
+            self._closes[symbol] = [close for _, close in rows]
+
+    def price(self, symbol: str, moment: datetime) -> float:
+        symbol = symbol.upper()
+        if symbol not in self._times:
+            return 0.0
+        index = bisect_right(self._times[symbol], moment.strftime(TIME_FORMAT))
+        return self._closes[symbol][max(index - 1, 0)]
+
+
+def parse_time(value: str | None) -> datetime | None:
+    return datetime.strptime(value, TIME_FORMAT) if value else None
+
+
+clock = SimulatedClock(
+    start=parse_time(os.getenv("SIMULATION_START")),
+    epoch=parse_time(os.getenv("SIMULATION_EPOCH")),
+    speed=SIMULATION_SPEED,
+)
+
+
+@lru_cache(maxsize=1)
+def get_market() -> GBMMarket | CSVMarket:
+    source = os.getenv("MARKET_SIMULATION", "gbm")
+    if source.lower().endswith(".csv"):
+        return CSVMarket(source)
+    return GBMMarket(SIMULATION_SEED, SIMULATION_CORRELATION)
+
+
+def get_share_price(symbol: str) -> float:
+    return get_market().price(symbol, clock.now())
+
+
+def get_share_prices(symbols: list[str]) -> dict[str, float]:
+    moment = clock.now()
+    market = get_market()
+    return {symbol: market.price(symbol, moment) for symbol in symbols}
+
+
+def is_market_open() -> bool:
+    return is_session_open(clock.now())
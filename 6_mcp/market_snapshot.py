@@ -0,0 +1,129 @@
+"""
+Compact on-disk snapshots of end-of-day closing prices, one file per date.
+
+Layout of a snapshot file, all little-endian:
+    header   MAGIC, then uint32 ticker count n, then uint32 ticker width w
+    tickers  n fixed-width ASCII tickers, sorted and NUL-padded to w bytes
+    closes   n float64 closing prices, aligned to 8 bytes, in ticker order
+
+Files are memory-mapped, so opening one costs a header read regardless of how many
+tickers it holds, and a lookup is a binary search over the ticker block.
+"""
+
+import mmap
+import os
+import struct
+from functools import lru_cache
+from database import list_market_dates, read_market, delete_market
+
+SNAPSHOT_DIR = "market_data"
+MAGIC = b"EODSNAP1"
+HEADER = struct.Struct("<8sII")
+
+
+def snapshot_path(date: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"{date}.eod")
+
+
+def write_snapshot(date: str, data: dict[str, float]) -> str:
+    """Write a snapshot atomically, so a concurrent reader never sees a partial file."""
+    tickers = sorted(ticker.encode("ascii") for ticker in data)
+    width = max((len(ticker) for ticker in tickers), default=1)
+    tickers_size = len(tickers) * width
+    padding = -(HEADER.size + tickers_size) % 8
+    closes = [float(data[ticker.decode("ascii")] or 0.0) for ticker in tickers]
+
+    path = snapshot_path(date)
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(tickers), width))
+        f.write(b"".join(ticker.ljust(width, b"\0") for ticker in tickers))
+        f.write(b"\0" * padding)
+        f.write(struct.pack(f"<{len(closes)}d", *closes))
+    os.replace(temporary, path)
+    return path
+
+
+class MarketSnapshot:
+    """Read-only view of a snapshot file with dict-style lookups."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, self._width = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a market snapshot")
+        tickers_end = HEADER.size + self._count * self._width
+        self._closes_offset = tickers_end + (-tickers_end % 8)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _ticker(self, index: int) -> bytes:
+        start = HEADER.size + index * self._width
+        return self._mm[start : start + self._width].rstrip(b"\0")
+
+    def _close(self, index: int) -> float:
+        return struct.unpack_from("<d", self._mm, self._closes_offset + index * 8)[0]
+
+    def _index(self, symbol: str) -> int | None:
+        try:
+            key = symbol.encode("ascii")
+        except UnicodeEncodeError:
+            return None
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._ticker(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count and self._ticker(low) == key:
+            return low
+        return None
+
+    def get(self, symbol: str, default: float | None = None) -> float | None:
+        index = self._index(symbol)
+        return default if index is None else self._close(index)
+
+    def __contains__(self, symbol: str) -> bool:
+        return self._index(symbol) is not None
+
+    def items(self):
+        for index in range(self._count):
+            yield self._ticker(index).decode("ascii"), self._close(index)
+
+
+@lru_cache(maxsize=8)
+def open_snapshot(date: str) -> MarketSnapshot | None:
+    """The snapshot for a date, if one has been written; imports a legacy market row if there is one."""
+    path = snapshot_path(date)
+    if not os.path.exists(path):
+        data = read_market(date)
+        if data is None:
+            return None
+        write_snapshot(date, data)
+        delete_market(date)
+    return MarketSnapshot(path)
+
+
+def snapshot_dates() -> list[str]:
+    """Every date with a snapshot on disk, oldest first."""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    return sorted(name.removesuffix(".eod") for name in os.listdir(SNAPSHOT_DIR) if name.endswith(".eod"))
+
+
+def import_market_rows() -> int:
+    """Convert every JSON market row in the database into a snapshot file; returns the count."""
+    dates = list_market_dates()
+    for date in dates:
+        write_snapshot(date, read_market(date))
+        delete_market(date)
+    open_snapshot.cache_clear()
+    return len(dates)
+
+
+if __name__ == "__main__":
+    print(f"Imported {import_market_rows()} market dates into {SNAPSHOT_DIR}/")
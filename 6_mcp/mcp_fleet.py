@@ -0,0 +1,168 @@
+import asyncio
+import json
+import os
+import time
+import psutil
+from agents.mcp import MCPServerStdio
+
+HEALTH_CHECK_INTERVAL = 15
+# Seconds a server may take to start and complete the MCP handshake before it is given up on
+MCP_SERVER_START_TIMEOUT = float(os.getenv("MCP_SERVER_START_TIMEOUT", "120"))
+
+
+def server_label(params: dict) -> str:
+    """A short readable name, e.g. 'uv run accounts_server.py' or 'npx mcp-memory-libsql (memory/warren.db)'"""
+    label = " ".join([params["command"], *[arg for arg in params.get("args", []) if not arg.startswith("-")]])
+    libsql_url = (params.get("env") or {}).get("LIBSQL_URL")
+    return f"{label} ({libsql_url.removeprefix('file:./')})" if libsql_url else label
+
+
+class ManagedServer:
+    """
+    An MCPServerStdio kept connected in its own task: the agents SDK requires connect() and
+    cleanup() to run in the same task, and the server outlives any one trader run.
+    """
+
+    def __init__(self, params: dict):
+        self.params = params
+        self.label = server_label(params)
+        self.server = MCPServerStdio(
+            params, cache_tools_list=True, name=self.label, client_session_timeout_seconds=120
+        )
+        self.processes: list[psutil.Process] = []
+        self.startup_seconds = None
+        self.error = None
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._task = None
+
+    async def start(self, timeout: float = MCP_SERVER_START_TIMEOUT) -> None:
+        before = {child.pid for child in psutil.Process().children(recursive=True)}
+        started = time.perf_counter()
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except TimeoutError:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            raise TimeoutError(f"MCP server {self.label} did not start within {timeout:g}s") from None
+        if self.error:
+            raise self.error
+        self.startup_seconds = time.perf_counter() - started
+        self.processes = [child for child in psutil.Process().children(recursive=True) if child.pid not in before]
+
+    async def _run(self) -> None:
+        try:
+            await self.server.connect()
+            self._ready.set()
+            await self._closing.wait()
+        except Exception as e:
+            self.error = e
+        finally:
+            self._ready.set()
+            await self.server.cleanup()
+
+    @property
+    def alive(self) -> bool:
+        if self._task is None or self._task.done():
+            return False
+        try:
+            return all(process.is_running() and process.status() != psutil.STATUS_ZOMBIE for process in self.processes)
+        except psutil.Error:
+            # The process has exited since is_running() was checked, or can no longer be inspected
+            return False
+
+    def rss_mb(self) -> float:
+        total = 0
+        for process in self.processes:
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                pass
+        return total / 1_000_000
+
+    async def close(self) -> None:
+        self._closing.set()
+        if self._task:
+            await self._task
+
+
+class MCPServerFleet:
+    """
+    The MCP servers for the whole trading floor, started once and kept running between cycles.
+
+    Servers are keyed by their launch parameters, so servers with identical parameters, such as
+    accounts, push, market, fetch and brave search, are shared by every trader, while the
+    per-trader memory server (which differs by LIBSQL_URL) is one per trader.
+    A background task restarts any server whose process has died.
+    Startups are serialized so each server's new child processes can be attributed to it for RSS metrics.
+    """
+
+    def __init__(self, health_check_interval: float = HEALTH_CHECK_INTERVAL):
+        self.health_check_interval = health_check_interval
+        self.servers: dict[str, ManagedServer] = {}
+        self.restarts: dict[str, int] = {}
+        self._start_lock = asyncio.Lock()
+        self._monitor = None
+
+    async def __aenter__(self) -> "MCPServerFleet":
+        self._monitor = asyncio.create_task(self._watch())
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self._monitor.cancel()
+        for managed in list(self.servers.values()):
+            await managed.close()
+        self.servers.clear()
+
+    async def get(self, params: dict) -> MCPServerStdio:
+        key = json.dumps(params, sort_keys=True)
+        async with self._start_lock:
+            managed = self.servers.get(key)
+            if managed is None or not managed.alive:
+                if managed is not None:
+                    print(f"Restarting MCP server {managed.label}")
+                    self.restarts[key] = self.restarts.get(key, 0) + 1
+                    await managed.close()
+                managed = ManagedServer(params)
+                await managed.start()
+                self.servers[key] = managed
+            return managed.server
+
+    async def get_all(self, params_list: list[dict]) -> list[MCPServerStdio]:
+        return [await self.get(params) for params in params_list]
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            for managed in list(self.servers.values()):
+                if not managed.alive:
+                    try:
+                        await self.get(managed.params)
+                    except Exception as e:
+                        print(f"Could not restart MCP server {managed.label}: {e}")
+
+    def metrics(self) -> list[dict]:
+        return [
+            {
+                "server": managed.label,
+                "startup_seconds": managed.startup_seconds,
+                "rss_mb": managed.rss_mb(),
+                "restarts": self.restarts.get(key, 0),
+                "alive": managed.alive,
+            }
+            for key, managed in self.servers.items()
+        ]
+
+    def report(self) -> str:
+        lines = [f"MCP server fleet ({len(self.servers)} servers, pid {os.getpid()})"]
+        for metric in self.metrics():
+            lines.append(
+                f"  {metric['server']:<60} startup {metric['startup_seconds']:>6.2f}s"
+                f"   rss {metric['rss_mb']:>7.1f} MB   restarts {metric['restarts']}"
+                f"{'' if metric['alive'] else '   DOWN'}"
+            )
+        return "\n".join(lines)
@@ -7,6 +7,9 @@ load_dotenv(override=True)
 brave_env = {"BRAVE_API_KEY": os.getenv("BRAVE_API_KEY")}
 polygon_api_key = os.getenv("POLYGON_API_KEY")
 
+# Serve the accounts, push and local market tools from one process instead of three
+MULTIPLEXED_MCP_SERVER = os.getenv("MULTIPLEXED_MCP_SERVER", "false").strip().lower() == "true"
+
 # The MCP server for the Trader to read Market Data
 
 if is_paid_polygon or is_realtime_polygon:
@@ -21,11 +24,16 @@ else:
 
 # The full set of MCP servers for the trader: Accounts, Push Notification and the Market
 
-trader_mcp_server_params = [
-    {"command": "uv", "args": ["run", "accounts_server.py"]},
-    {"command": "uv", "args": ["run", "push_server.py"]},
-    market_mcp,
-]
+if MULTIPLEXED_MCP_SERVER:
+    trader_mcp_server_params = [{"command": "uv", "args": ["run", "trading_server.py"]}]
+    if is_paid_polygon or is_realtime_polygon:
+        trader_mcp_server_params.append(market_mcp)
+else:
+    trader_mcp_server_params = [
+        {"command": "uv", "args": ["run", "accounts_server.py"]},
+        {"command": "uv", "args": ["run", "push_server.py"]},
+        market_mcp,
+    ]
 
 # The full set of MCP servers for the researcher: Fetch, Brave Search and Memory
 
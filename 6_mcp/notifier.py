@@ -0,0 +1,171 @@
+"""
+Push notifications sent from a background task, so a slow or failing notification service never
+holds up the tool call that asked for one.
+
+notify() only queues the message. The background task waits NOTIFY_COALESCE_SECONDS after the
+first message of a burst, then sends everything that arrived in that window as one notification,
+with repeated messages collapsed into one line. Sends go through one pooled HTTP client with
+timeouts, and are retried with exponential backoff only when Pushover cannot have received them
+(connection errors and 429s), so a retry never delivers a notification twice.
+
+NOTIFY_SINK selects where notifications go:
+    pushover   the Pushover API, with PUSHOVER_USER and PUSHOVER_TOKEN (the default when both are set)
+    file       appended as JSON lines to NOTIFY_FILE, for running offline (the default otherwise)
+"""
+
+import asyncio
+import json
+import os
+import random
+import sys
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+pushover_user = os.getenv("PUSHOVER_USER")
+pushover_token = os.getenv("PUSHOVER_TOKEN")
+pushover_url = "https://api.pushover.net/1/messages.json"
+
+NOTIFY_SINK = os.getenv("NOTIFY_SINK", "pushover" if pushover_user and pushover_token else "file")
+NOTIFY_FILE = os.getenv("NOTIFY_FILE", "notifications.jsonl")
+NOTIFY_COALESCE_SECONDS = float(os.getenv("NOTIFY_COALESCE_SECONDS", "2"))
+NOTIFY_ATTEMPTS = 4
+NOTIFY_BACKOFF_SECONDS = 1.0
+NOTIFY_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+
+# Pushover rejects longer messages
+MAX_MESSAGE_LENGTH = 1024
+
+
+class PushoverSink:
+    """Sends through one pooled client, retrying undelivered sends with exponential backoff and jitter."""
+
+    def __init__(self, user: str, token: str, attempts: int = NOTIFY_ATTEMPTS):
+        self.user = user
+        self.token = token
+        self.attempts = attempts
+        self.client = httpx.AsyncClient(
+            timeout=NOTIFY_TIMEOUT, limits=httpx.Limits(max_connections=2, max_keepalive_connections=2)
+        )
+
+    async def send(self, message: str) -> None:
+        payload = {"user": self.user, "token": self.token, "message": message}
+        for attempt in range(self.attempts):
+            retry_after = None
+            try:
+                response = await self.client.post(pushover_url, data=payload)
+                if response.status_code != 429:
+                    response.raise_for_status()
+                    return
+                retry_after = response.headers.get("Retry-After")
+                error = f"HTTP {response.status_code}"
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                error = repr(e)
+            if attempt == self.attempts - 1:
+                raise RuntimeError(f"Push notification failed after {self.attempts} attempts: {error}")
+            delay = NOTIFY_BACKOFF_SECONDS * 2**attempt * random.uniform(0.5, 1.5)
+            await asyncio.sleep(float(retry_after) if retry_after and retry_after.isdigit() else delay)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+class FileSink:
+    """Appends notifications to a JSON lines file instead of sending them."""
+
+    def __init__(self, path: str = NOTIFY_FILE):
+        self.path = path
+
+    def append(self, message: str) -> None:
+        record = {"datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "message": message}
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    async def send(self, message: str) -> None:
+        await asyncio.to_thread(self.append, message)
+
+    async def aclose(self) -> None:
+        pass
+
+
+def coalesce(messages: list[str]) -> str:
+    """One message for a burst: each distinct message once, in order of arrival, with a count if repeated."""
+    counts = Counter(messages)
+    lines = [message if counts[message] == 1 else f"{message} (x{counts[message]})" for message in counts]
+    text = "\n".join(lines)
+    return text if len(text) <= MAX_MESSAGE_LENGTH else text[: MAX_MESSAGE_LENGTH - 1] + "…"
+
+
+class Notifier:
+    def __init__(self, sink, window: float = NOTIFY_COALESCE_SECONDS):
+        self.sink = sink
+        self.window = window
+        self.sent = 0
+        self.failed = 0
+        self._queue: asyncio.Queue[str] | None = None
+        self._task: asyncio.Task | None = None
+        self._pending: list[str] = []  # the burst being collected or sent
+
+    def notify(self, message: str) -> None:
+        """Queue a message; this returns at once, and must be called from the event loop's thread."""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        self._queue.put_nowait(message)
+
+    async def _run(self) -> None:
+        while True:
+            self._pending = [await self._queue.get()]
+            await asyncio.sleep(self.window)
+            while not self._queue.empty():
+                self._pending.append(self._queue.get_nowait())
+            await self._send(self._pending)
+            self._pending = []
+
+    async def _send(self, messages: list[str]) -> None:
+        try:
+            await self.sink.send(coalesce(messages))
+            self.sent += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"Could not send {len(messages)} notifications: {e}", file=sys.stderr)
+
+    async def aclose(self) -> None:
+        """Send whatever is still queued, then close the sink."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            messages, self._pending = self._pending, []
+            while not self._queue.empty():
+                messages.append(self._queue.get_nowait())
+            if messages:
+                await self._send(messages)
+            self._task = None
+        await self.sink.aclose()
+
+
+def make_sink(kind: str = NOTIFY_SINK):
+    if kind == "pushover":
+        return PushoverSink(pushover_user, pushover_token)
+    if kind == "file":
+        return FileSink()
+    raise ValueError(f"NOTIFY_SINK must be pushover or file, not {kind!r}")
+
+
+notifier = Notifier(make_sink())
+
+
+@asynccontextmanager
+async def notifier_lifespan(server):
+    """A FastMCP lifespan that sends any queued notifications before the server exits."""
+    try:
+        yield {}
+    finally:
+        await notifier.aclose()
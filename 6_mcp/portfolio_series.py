@@ -0,0 +1,77 @@
+from datetime import datetime
+from database import read_portfolio_values, read_portfolio_rollups, portfolio_value_range, complete_timestamp
+
+MAX_CHART_POINTS = 500
+
+# The seconds one point covers at each resolution, finest first. Raw snapshots are written on
+# every report(), which is assumed to be no more often than every 15 seconds.
+RESOLUTION_SECONDS = {"raw": 15, "1m": 60, "1h": 3_600, "1d": 86_400}
+
+# Read up to this many times the points to draw, then downsample
+OVERSAMPLE = 4
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def choose_resolution(span_seconds: float, max_points: int = MAX_CHART_POINTS) -> str:
+    """The finest resolution that covers the span in no more than OVERSAMPLE * max_points points."""
+    for resolution, seconds in RESOLUTION_SECONDS.items():
+        if span_seconds / seconds <= max_points * OVERSAMPLE:
+            return resolution
+    return "1d"
+
+
+def lttb(points: list[tuple[float, float]], threshold: int) -> list[int]:
+    """
+    Largest-Triangle-Three-Buckets downsampling: the indices of at most threshold points that
+    keep the visual shape of the series, always including the first and last.
+    """
+    if threshold >= len(points) or threshold < 3:
+        return list(range(len(points)))
+    selected = [0]
+    every = (len(points) - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third vertex of the triangle
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, len(points))
+        next_points = points[next_start:next_end]
+        average_x = sum(x for x, _ in next_points) / len(next_points)
+        average_y = sum(y for _, y in next_points) / len(next_points)
+
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        ax, ay = points[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - average_x) * (y - ay) - (ax - x) * (average_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(len(points) - 1)
+    return selected
+
+
+def query_portfolio_series(
+    name: str, start: str | None = None, end: str | None = None, max_points: int = MAX_CHART_POINTS
+) -> list[tuple[str, float]]:
+    """
+    The portfolio value series for a window (the whole history by default) as (timestamp, value),
+    read from the coarsest-needed rollup and downsampled to at most max_points.
+    """
+    first, last = portfolio_value_range(name)
+    if first is None:
+        return []
+    start, end = start or first, end or last
+    span = (datetime.strptime(end, TIMESTAMP_FORMAT) - datetime.strptime(start, TIMESTAMP_FORMAT)).total_seconds()
+    resolution = choose_resolution(span, max_points)
+    if resolution == "raw":
+        series = read_portfolio_values(name, start, end)
+    else:
+        series = [
+            (complete_timestamp(bucket), close)
+            for bucket, _, _, _, close in read_portfolio_rollups(name, resolution, start, end)
+        ]
+    points = [(datetime.strptime(timestamp, TIMESTAMP_FORMAT).timestamp(), value) for timestamp, value in series]
+    return [series[index] for index in lttb(points, max_points)]
@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Callable
+from database import write_prices, read_prices
+
+
+class PriceCache:
+    """
+    A two-tier share price cache in front of an upstream fetch function.
+
+    The first tier is an in-process dict; the second is the prices table in the shared
+    database, so the accounts server, market server and app processes reuse each other's
+    lookups. An entry younger than ttl seconds is fresh. For a further max_stale seconds
+    it is still served, while a background thread fetches a new price (stale-while-revalidate).
+    Older entries are fetched from upstream before returning; when several threads miss the
+    same symbol at once, the first fetches it and the others wait for its result (single-flight).
+    """
+
+    def __init__(self, ttl: float, max_stale: float):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.stats = Counter()
+        self._entries: dict[str, tuple[float, float]] = {}
+        self._refreshing: set[str] = set()
+        # symbol -> the result of the upstream fetch in flight for it
+        self._pending: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, symbols: list[str], fetch: Callable[[list[str]], dict[str, float]]) -> dict[str, float]:
+        now = time.time()
+        prices, stale = {}, []
+        with self._lock:
+            missing = self._classify(symbols, self._entries, now, prices, stale, "hits")
+        if missing:
+            shared = read_prices(missing)
+            with self._lock:
+                self._entries.update(shared)
+                missing = self._classify(missing, shared, now, prices, stale, "shared_hits")
+        if missing:
+            prices.update(self._fetch_once(missing, fetch))
+        if stale:
+            self._revalidate(stale, fetch)
+        return prices
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _classify(self, symbols, entries, now, prices, stale, counter) -> list[str]:
+        """Fill prices from entries, noting stale symbols; returns the symbols still missing."""
+        missing = []
+        for symbol in symbols:
+            entry = entries.get(symbol)
+            age = now - entry[1] if entry else None
+            if entry and age < self.ttl:
+                self.stats[counter] += 1
+                prices[symbol] = entry[0]
+            elif entry and age < self.ttl + self.max_stale:
+                self.stats["stale_hits"] += 1
+                prices[symbol] = entry[0]
+                stale.append(symbol)
+            else:
+                missing.append(symbol)
+        return missing
+
+    def _fetch_once(self, symbols, fetch) -> dict[str, float]:
+        """Fetch the symbols no other thread is fetching, and share the result of those that are."""
+        flight = Future()
+        with self._lock:
+            waiting = {symbol: self._pending[symbol] for symbol in symbols if symbol in self._pending}
+            mine = [symbol for symbol in symbols if symbol not in waiting]
+            self._pending.update({symbol: flight for symbol in mine})
+            self.stats["misses"] += len(mine)
+            self.stats["coalesced"] += len(waiting)
+        if mine:
+            try:
+                flight.set_result(self._fetch(mine, fetch))
+            except Exception as e:
+                flight.set_exception(e)
+            finally:
+                with self._lock:
+                    for symbol in mine:
+                        del self._pending[symbol]
+        prices = dict(flight.result()) if mine else {}
+        for symbol, other in waiting.items():
+            if symbol in other.result():
+                prices[symbol] = other.result()[symbol]
+        return prices
+
+    def _fetch(self, symbols, fetch) -> dict[str, float]:
+        prices = fetch(symbols)
+        fetched_at = time.time()
+        with self._lock:
+            self._entries.update({symbol: (price, fetched_at) for symbol, price in prices.items()})
+        write_prices(prices, fetched_at)
+        return prices
+
+    def _revalidate(self, symbols, fetch) -> None:
+        with self._lock:
+            symbols = [symbol for symbol in symbols if symbol not in self._refreshing]
+            self._refreshing.update(symbols)
+        if not symbols:
+            return
+
+        def refresh():
+            try:
+                self._fetch(symbols, fetch)
+                with self._lock:
+                    self.stats["refreshes"] += len(symbols)
+            except Exception as e:
+                with self._lock:
+                    self.stats["refresh_errors"] += 1
+                print(f"Background price refresh failed due to {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.difference_update(symbols)
+
+        threading.Thread(target=refresh, name="price-refresh", daemon=True).start()
@@ -0,0 +1,186 @@
+import asyncio
+import os
+import random
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+from database import write_cycle_metric
+from traders import Trader, get_provider
+
+load_dotenv(override=True)
+
+# Limits applied per model provider: how many trader runs may be in flight at once, and how
+# many may start per minute (with bursts up to the concurrency limit)
+PROVIDER_CONCURRENCY = int(os.getenv("PROVIDER_CONCURRENCY", "2"))
+PROVIDER_RUNS_PER_MINUTE = float(os.getenv("PROVIDER_RUNS_PER_MINUTE", "6"))
+
+# Each trader starts at a random offset of up to this many seconds into the cycle
+START_JITTER_SECONDS = float(os.getenv("START_JITTER_SECONDS", "30"))
+
+# A trader run is cancelled after this long; by default, just short of the cycle length
+TRADER_TIMEOUT_SECONDS = os.getenv("TRADER_TIMEOUT_SECONDS")
+
+
+class TokenBucket:
+    """Allows rate events per second on average, with bursts of up to capacity."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ProviderLimiter:
+    """The concurrency semaphore and rate limit shared by every trader using one provider."""
+
+    def __init__(self, concurrency: int, runs_per_minute: float):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(runs_per_minute / 60, concurrency)
+
+    async def __aenter__(self) -> "ProviderLimiter":
+        await self.semaphore.acquire()
+        try:
+            await self.bucket.acquire()
+        except BaseException:
+            self.semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.semaphore.release()
+
+
+def now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class TraderScheduler:
+    """
+    Runs every trader at a fixed rate: cycle k is due at start + k * interval however long the
+    previous cycle took, and a cycle that is missed entirely (e.g. after the machine slept) is skipped.
+
+    Each cycle launches the traders as independent tasks, each starting at a jittered offset and
+    queueing on its provider's limiter, and cancelled after the timeout. A trader whose previous
+    run is still in flight sits the cycle out, so one slow trader never delays the others or the
+    next cycle. Every run's timings, outcome, token usage and cost are written to the cycle_metrics table.
+    """
+
+    def __init__(
+        self,
+        traders: list[Trader],
+        interval: float,
+        timeout: float | None = None,
+        jitter: float = START_JITTER_SECONDS,
+        should_run=lambda: True,
+        on_cycle=lambda: None,
+    ):
+        self.traders = traders
+        self.interval = interval
+        self.timeout = timeout or (float(TRADER_TIMEOUT_SECONDS) if TRADER_TIMEOUT_SECONDS else interval * 0.9)
+        self.jitter = min(jitter, interval / 2)
+        self.should_run = should_run
+        self.on_cycle = on_cycle
+        self.limiters: dict[str, ProviderLimiter] = {}
+        self.running: dict[str, asyncio.Task] = {}
+        self.cycle = 0
+
+    def limiter(self, provider: str) -> ProviderLimiter:
+        if provider not in self.limiters:
+            self.limiters[provider] = ProviderLimiter(PROVIDER_CONCURRENCY, PROVIDER_RUNS_PER_MINUTE)
+        return self.limiters[provider]
+
+    async def run_forever(self) -> None:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            while True:
+                if self.should_run():
+                    self.on_cycle()
+                    self.start_cycle()
+                else:
+                    print("Market is closed, skipping run")
+                elapsed = loop.time() - start
+                next_cycle = int(elapsed // self.interval) + 1
+                await asyncio.sleep(start + next_cycle * self.interval - loop.time())
+        finally:
+            for task in self.running.values():
+                task.cancel()
+
+    def start_cycle(self) -> None:
+        self.cycle += 1
+        scheduled_at = now()
+        for trader in self.traders:
+            previous = self.running.get(trader.name)
+            if previous and not previous.done():
+                print(f"{trader.name} is still running from an earlier cycle; skipping it in cycle {self.cycle}")
+                write_cycle_metric(self.metric(trader, scheduled_at, status="skipped"))
+                continue
+            self.running[trader.name] = asyncio.create_task(self.run_trader(trader, self.cycle, scheduled_at))
+
+    async def run_trader(self, trader: Trader, cycle: int, scheduled_at: str) -> None:
+        provider = get_provider(trader.model_name)
+        status, started_at, run_seconds = "ok", None, None
+        queued = time.monotonic()
+        try:
+            await asyncio.sleep(random.uniform(0, self.jitter))
+            queued = time.monotonic()
+            async with self.limiter(provider):
+                started_at = now()
+                wait_seconds = time.monotonic() - queued
+                started = time.monotonic()
+                try:
+                    status = await asyncio.wait_for(trader.run(), self.timeout)
+                except asyncio.TimeoutError:
+                    status = "timeout"
+                    print(f"{trader.name} timed out after {self.timeout:.0f} seconds in cycle {cycle}")
+                run_seconds = time.monotonic() - started
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        finally:
+            usage = getattr(trader, "last_usage", None) if started_at else None
+            write_cycle_metric(
+                self.metric(
+                    trader,
+                    scheduled_at,
+                    cycle=cycle,
+                    started_at=started_at,
+                    finished_at=now(),
+                    wait_seconds=wait_seconds if started_at else time.monotonic() - queued,
+                    run_seconds=run_seconds,
+                    status=status,
+                    input_tokens=usage.input_tokens if usage else None,
+                    output_tokens=usage.output_tokens if usage else None,
+                    cost=usage.cost if usage else None,
+                )
+            )
+
+    def metric(self, trader: Trader, scheduled_at: str, **values) -> dict:
+        return {
+            "cycle": self.cycle,
+            "name": trader.name,
+            "provider": get_provider(trader.model_name),
+            "scheduled_at": scheduled_at,
+            "started_at": None,
+            "finished_at": None,
+            "wait_seconds": None,
+            "run_seconds": None,
+            "status": None,
+            "input_tokens": None,
+            "output_tokens": None,
+            "cost": None,
+            **values,
+        }
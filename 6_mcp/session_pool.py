@@ -0,0 +1,194 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+import anyio
+import mcp
+from mcp import StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED
+
+# Errors that mean the server process or its pipes went away, so the call is retried on a new session
+DISCONNECT_ERRORS = (
+    anyio.ClosedResourceError,
+    anyio.BrokenResourceError,
+    anyio.EndOfStream,
+    ConnectionError,
+    EOFError,
+)
+
+
+def is_disconnect(error: BaseException) -> bool:
+    """Whether an error means the server went away, including the McpError a session raises on "Connection closed"."""
+    if isinstance(error, McpError):
+        return error.error.code == CONNECTION_CLOSED
+    return isinstance(error, DISCONNECT_ERRORS)
+
+
+class PooledSession:
+    """
+    One long-lived MCP client session over stdio. The stdio_client and ClientSession contexts
+    must be entered and exited by the same task, so they are held open by a background task
+    until close() is called or the server goes away.
+    """
+
+    def __init__(self, params: StdioServerParameters):
+        self.params = params
+        self.session: mcp.ClientSession | None = None
+        self.in_use = 0
+        self.last_used = time.monotonic()
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._error: BaseException | None = None
+
+    async def start(self, timeout: float) -> None:
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise
+        if self.session is None:
+            raise ConnectionError(f"Could not start {self.params.command} {' '.join(self.params.args)}: {self._error}")
+
+    async def _run(self) -> None:
+        try:
+            async with stdio_client(self.params) as streams:
+                async with mcp.ClientSession(*streams) as session:
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    await self._closing.wait()
+        except Exception as e:
+            self._error = e
+        finally:
+            self.session = None
+            self._ready.set()
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def ping(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout)
+            return True
+        except Exception:
+            return False
+
+    async def close(self) -> None:
+        self._closing.set()
+        if self._task:
+            try:
+                await asyncio.wait_for(self._task, 5)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                self._task.cancel()
+
+
+class SessionPool:
+    """
+    A reference-counted pool of persistent MCP client sessions to one stdio server.
+
+    Callers borrow a session with `async with pool.session() as session`, which starts one on
+    first use, runs a ping health check on sessions idle for longer than health_check_after
+    seconds, and caps concurrent requests across the pool at max_concurrency.
+    Long-running owners hold a reference with `async with pool:`; when the last reference
+    is released every session is closed. call() retries once on a fresh session if the
+    server process has died.
+    """
+
+    def __init__(
+        self,
+        params: StdioServerParameters,
+        size: int = 2,
+        max_concurrency: int = 8,
+        start_timeout: float = 60,
+        health_check_after: float = 30,
+    ):
+        self.params = params
+        self.size = size
+        self.max_concurrency = max_concurrency
+        self.start_timeout = start_timeout
+        self.health_check_after = health_check_after
+        self.references = 0
+        self._sessions: list[PooledSession] = []
+        self._loop = None
+        self._lock = None
+        self._semaphore = None
+
+    def _bind_to_running_loop(self) -> None:
+        # Sessions and asyncio primitives belong to one event loop; start afresh under a new one
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._sessions = []
+            self._lock = asyncio.Lock()
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def __aenter__(self) -> "SessionPool":
+        self._bind_to_running_loop()
+        self.references += 1
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.references -= 1
+        if self.references == 0:
+            await self.close()
+
+    async def _checkout(self) -> PooledSession:
+        async with self._lock:
+            self._sessions = [pooled for pooled in self._sessions if pooled.alive]
+            if len(self._sessions) < self.size and all(pooled.in_use for pooled in self._sessions):
+                pooled = PooledSession(self.params)
+                await pooled.start(self.start_timeout)
+                self._sessions.append(pooled)
+            pooled = min(self._sessions, key=lambda candidate: candidate.in_use)
+            pooled.in_use += 1
+        idle = time.monotonic() - pooled.last_used
+        if idle > self.health_check_after and not await pooled.ping(self.start_timeout):
+            pooled.in_use -= 1
+            await pooled.close()
+            return await self._checkout()
+        return pooled
+
+    @asynccontextmanager
+    async def session(self):
+        self._bind_to_running_loop()
+        async with self._semaphore:
+            pooled = await self._checkout()
+            try:
+                yield pooled.session
+            except Exception as e:
+                if is_disconnect(e):
+                    await pooled.close()
+                raise
+            finally:
+                pooled.in_use -= 1
+                pooled.last_used = time.monotonic()
+
+    async def call(self, operation):
+        """Run operation(session) on a pooled session, retrying once if the server disconnected."""
+        try:
+            async with self.session() as session:
+                return await operation(session)
+        except Exception as e:
+            if not is_disconnect(e):
+                raise
+        async with self.session() as session:
+            return await operation(session)
+
+    async def health_check(self) -> dict[int, bool]:
+        """Ping every open session, closing the ones that don't answer."""
+        self._bind_to_running_loop()
+        results = {}
+        for index, pooled in enumerate(list(self._sessions)):
+            results[index] = pooled.alive and await pooled.ping(self.start_timeout)
+            if not results[index]:
+                await pooled.close()
+        return results
+
+    async def close(self) -> None:
+        sessions, self._sessions = self._sessions, []
+        for pooled in sessions:
+            await pooled.close()
@@ -1,12 +1,12 @@
 from datetime import datetime
-from market import is_paid_polygon, is_realtime_polygon
+from market import is_paid_polygon, is_realtime_polygon, market_time
 
 if is_realtime_polygon:
     note = "You have access to realtime market data tools; use your get_last_trade tool for the latest trade price. You can also use tools for share information, trends and technical indicators and fundamentals."
 elif is_paid_polygon:
     note = "You have access to market data tools but without access to the trade or quote tools; use your get_snapshot_ticker tool to get the latest share price on a 15 min delay. You can also use tools for share information, trends and technical indicators and fundamentals."
 else:
-    note = "You have access to end of day market data; use you get_share_price tool to get the share price as of the prior close."
+    note = "You have access to end of day market data; use your lookup_share_price tool to get the share price as of the prior close, or lookup_share_prices to price several symbols in one call."
 
 
 def researcher_instructions():
@@ -40,6 +40,8 @@ You actively manage your portfolio according to your strategy.
 You have access to tools including a researcher to research online for news and opportunities, based on your request.
 You also have tools to access to financial data for stocks. {note}
 And you have tools to buy and sell stocks using your account name {name}.
+When you want to make several trades, such as when rebalancing, use execute_orders to place them all in one call.
+Your account summary shows only your latest trades; use list_transactions if you need to look further back.
 You can use your entity tools as a persistent memory to store and recall information; you share
 this memory with other traders and can benefit from the group's knowledge.
 Use these tools to carry out research, make decisions, and execute trades.
@@ -61,7 +63,7 @@ Your investment strategy:
 Here is your current account:
 {account}
 Here is the current datetime:
-{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+{market_time().strftime("%Y-%m-%d %H:%M:%S")}
 Now, carry out analysis, make your decision and execute trades. Your account name is {name}.
 After you've executed your trades, send a push notification with a brief sumnmary of trades and the health of the portfolio, then
 respond with a brief 2-3 sentence appraisal of your portfolio and its outlook.
@@ -80,7 +82,7 @@ You also have a tool to change your strategy if you wish; you can decide at any
 Here is your current account:
 {account}
 Here is the current datetime:
-{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+{market_time().strftime("%Y-%m-%d %H:%M:%S")}
 Now, carry out analysis, make your decision and execute trades. Your account name is {name}.
 After you've executed your trades, send a push notification with a brief sumnmary of trades and the health of the portfolio, then
 respond with a brief 2-3 sentence appraisal of your portfolio and its outlook."""
\ No newline at end of file
@@ -1,7 +1,10 @@
 from agents import TracingProcessor, Trace, Span
-from database import write_log
+from database import write_log, write_span, log_writer, span_writer
+from costs import usage_meter
+from datetime import datetime, timezone
 import secrets
 import string
+import time
 
 ALPHANUM = string.ascii_lowercase + string.digits 
 
@@ -15,7 +18,40 @@ def make_trace_id(tag: str) -> str:
     random_suffix = ''.join(secrets.choice(ALPHANUM) for _ in range(pad_len))
     return f"trace_{tag}{random_suffix}"
 
+def utc_now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+def span_details(span_data) -> dict:
+    """The label, MCP server, model and token usage of a span, where its type records them."""
+    details = {"label": getattr(span_data, "name", None), "server": getattr(span_data, "server", None)}
+    mcp_data = getattr(span_data, "mcp_data", None)
+    if mcp_data:
+        details["server"] = mcp_data.get("server")
+    usage = getattr(span_data, "usage", None)
+    response = getattr(span_data, "response", None)
+    if response is not None:
+        details["model"] = response.model
+        usage = response.usage
+    elif getattr(span_data, "model", None):
+        details["model"] = span_data.model
+    if isinstance(usage, dict):
+        details["input_tokens"] = usage.get("input_tokens", usage.get("prompt_tokens"))
+        details["output_tokens"] = usage.get("output_tokens", usage.get("completion_tokens"))
+    elif usage is not None:
+        details["input_tokens"] = usage.input_tokens
+        details["output_tokens"] = usage.output_tokens
+    details["label"] = details["label"] or details["server"] or details.get("model")
+    return details
+
 class LogTracer(TracingProcessor):
+    """
+    Writes a log line when each trace and span starts and ends, and a structured record of each
+    finished span to the spans table, timed with the monotonic clock. The token usage of model
+    calls is also added to the usage meter, which the budget caps check.
+    """
+
+    def __init__(self):
+        self.started: dict[str, tuple[float, str]] = {}
 
     def get_name(self, trace_or_span: Trace | Span) -> str | None:
         trace_id = trace_or_span.trace_id
@@ -39,6 +75,7 @@ class LogTracer(TracingProcessor):
         name = self.get_name(span)
         type = span.span_data.type if span.span_data else "span"
         if name:
+            self.started[span.span_id] = (time.monotonic(), utc_now())
             message = "Started"
             if span.span_data:
                 if span.span_data.type:
@@ -67,9 +104,32 @@ class LogTracer(TracingProcessor):
             if span.error:
                 message += f" {span.error}"
             write_log(name, type, message)
+            self.record_span(name, type, span)
+
+    def record_span(self, name: str, type: str, span) -> None:
+        ended = time.monotonic()
+        started, started_at = self.started.pop(span.span_id, (ended, utc_now()))
+        details = span_details(span.span_data) if span.span_data else {}
+        if type in ("generation", "response") and details.get("input_tokens") is not None:
+            usage_meter.add(span.trace_id, details.get("model"), details["input_tokens"], details["output_tokens"] or 0)
+        write_span({
+            "span_id": span.span_id,
+            "trace_id": span.trace_id,
+            "parent_id": span.parent_id,
+            "name": name,
+            "type": type,
+            "started_at": started_at,
+            "start_monotonic": started,
+            "end_monotonic": ended,
+            "duration_ms": (ended - started) * 1000,
+            "error": span.error["message"] if span.error else None,
+            **details,
+        })
 
     def force_flush(self) -> None:
-        pass
+        log_writer.flush()
+        span_writer.flush()
 
     def shutdown(self) -> None:
-        pass
\ No newline at end of file
+        log_writer.shutdown()
+        span_writer.shutdown()
\ No newline at end of file
@@ -1,11 +1,10 @@
 from contextlib import AsyncExitStack
-from accounts_client import read_accounts_resource, read_strategy_resource
+from accounts_client import read_digest_resource, read_strategy_resource
 from tracers import make_trace_id
 from agents import Agent, Tool, Runner, OpenAIChatCompletionsModel, trace
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
 import os
-import json
 from agents.mcp import MCPServerStdio
 from templates import (
     researcher_instructions,
@@ -15,6 +14,11 @@ from templates import (
     research_tool,
 )
 from mcp_params import trader_mcp_server_params, researcher_mcp_server_params
+from llm_cache import LLM_CACHE_MODE, cached_client
+from costs import BudgetHooks, BudgetExceeded, usage_meter
+from database import write_run_cost, read_spent_since
+from datetime import datetime, timezone
+from functools import lru_cache
 
 load_dotenv(override=True)
 
@@ -36,63 +40,92 @@ grok_client = AsyncOpenAI(base_url=GROK_BASE_URL, api_key=grok_api_key)
 gemini_client = AsyncOpenAI(base_url=GEMINI_BASE_URL, api_key=google_api_key)
 
 
+@lru_cache(maxsize=1)
+def get_openai_client() -> AsyncOpenAI:
+    return AsyncOpenAI()
+
+
 def get_model(model_name: str):
+    """The model for a name; when LLM_CACHE records or replays, OpenAI models also go through chat completions."""
     if "/" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=openrouter_client)
+        client = openrouter_client
     elif "deepseek" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=deepseek_client)
+        client = deepseek_client
     elif "grok" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=grok_client)
+        client = grok_client
     elif "gemini" in model_name:
-        return OpenAIChatCompletionsModel(model=model_name, openai_client=gemini_client)
-    else:
+        client = gemini_client
+    elif LLM_CACHE_MODE == "passthrough":
         return model_name
+    else:
+        client = get_openai_client()
+    return OpenAIChatCompletionsModel(model=model_name, openai_client=cached_client(client))
+
+
+def get_provider(model_name: str) -> str:
+    """The model provider whose rate limits a model counts against, matching get_model's routing."""
+    if "/" in model_name:
+        return "openrouter"
+    elif "deepseek" in model_name:
+        return "deepseek"
+    elif "grok" in model_name:
+        return "grok"
+    elif "gemini" in model_name:
+        return "gemini"
+    else:
+        return "openai"
 
 
-async def get_researcher(mcp_servers, model_name) -> Agent:
+async def get_researcher(mcp_servers, model_name, hooks=None) -> Agent:
     researcher = Agent(
         name="Researcher",
         instructions=researcher_instructions(),
         model=get_model(model_name),
         mcp_servers=mcp_servers,
+        hooks=hooks,
     )
     return researcher
 
 
-async def get_researcher_tool(mcp_servers, model_name) -> Tool:
-    researcher = await get_researcher(mcp_servers, model_name)
+async def get_researcher_tool(mcp_servers, model_name, hooks=None) -> Tool:
+    researcher = await get_researcher(mcp_servers, model_name, hooks)
     return researcher.as_tool(tool_name="Researcher", tool_description=research_tool())
 
 
 class Trader:
-    def __init__(self, name: str, lastname="Trader", model_name="gpt-4o-mini"):
+    def __init__(self, name: str, lastname="Trader", model_name="gpt-4o-mini", fleet=None):
         self.name = name
         self.lastname = lastname
         self.agent = None
         self.model_name = model_name
         self.do_trade = True
+        self.fleet = fleet
+        self.budget = None
+        self.last_usage = None
+        self.last_status = None
 
     async def create_agent(self, trader_mcp_servers, researcher_mcp_servers) -> Agent:
-        tool = await get_researcher_tool(researcher_mcp_servers, self.model_name)
+        tool = await get_researcher_tool(researcher_mcp_servers, self.model_name, self.budget)
         self.agent = Agent(
             name=self.name,
             instructions=trader_instructions(self.name),
             model=get_model(self.model_name),
             tools=[tool],
             mcp_servers=trader_mcp_servers,
+            hooks=self.budget,
         )
         return self.agent
 
     async def get_account_report(self) -> str:
-        account = await read_accounts_resource(self.name)
-        account_json = json.loads(account)
-        account_json.pop("portfolio_value_time_series", None)
-        return json.dumps(account_json)
+        return await read_digest_resource(self.name)
+
+    async def get_strategy(self) -> str:
+        return await read_strategy_resource(self.name)
 
     async def run_agent(self, trader_mcp_servers, researcher_mcp_servers):
         self.agent = await self.create_agent(trader_mcp_servers, researcher_mcp_servers)
         account = await self.get_account_report()
-        strategy = await read_strategy_resource(self.name)
+        strategy = await self.get_strategy()
         message = (
             trade_message(self.name, strategy, account)
             if self.do_trade
@@ -101,6 +134,11 @@ class Trader:
         await Runner.run(self.agent, message, max_turns=MAX_TURNS)
 
     async def run_with_mcp_servers(self):
+        if self.fleet:
+            trader_mcp_servers = await self.fleet.get_all(trader_mcp_server_params)
+            researcher_mcp_servers = await self.fleet.get_all(researcher_mcp_server_params(self.name))
+            await self.run_agent(trader_mcp_servers, researcher_mcp_servers)
+            return
         async with AsyncExitStack() as stack:
             trader_mcp_servers = [
                 await stack.enter_async_context(
@@ -118,14 +156,43 @@ class Trader:
                 await self.run_agent(trader_mcp_servers, researcher_mcp_servers)
 
     async def run_with_trace(self):
+        """Run in a trace, within the budget caps, and record the run's token usage and cost."""
         trace_name = f"{self.name}-trading" if self.do_trade else f"{self.name}-rebalancing"
         trace_id = make_trace_id(f"{self.name.lower()}")
-        with trace(trace_name, trace_id=trace_id):
-            await self.run_with_mcp_servers()
-
-    async def run(self):
+        started_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        self.budget = BudgetHooks(self.name, trace_id, read_spent_since(self.name, f"{started_at[:10]} 00:00:00"))
+        status = "cancelled"
+        try:
+            self.budget.check()
+            with trace(trace_name, trace_id=trace_id):
+                await self.run_with_mcp_servers()
+            status = "ok"
+        except BudgetExceeded:
+            status = "over budget"
+            raise
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            self.last_status = status
+            self.last_usage = usage_meter.pop(trace_id)
+            write_run_cost({
+                "name": self.name,
+                "trace_id": trace_id,
+                "model": self.model_name,
+                "started_at": started_at,
+                "status": status,
+                **vars(self.last_usage),
+            })
+
+    async def run(self) -> str:
+        """Run once, then switch between trading and rebalancing; returns the outcome: ok, over budget or error."""
+        self.last_status = "error"  # until run_with_trace records the run's own outcome
         try:
             await self.run_with_trace()
         except Exception as e:
             print(f"Error running trader {self.name}: {e}")
-        self.do_trade = not self.do_trade
+        finally:
+            # Even when the scheduler cancels a run that timed out, so the next run takes the other turn
+            self.do_trade = not self.do_trade
+        return self.last_status
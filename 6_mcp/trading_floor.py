@@ -1,9 +1,14 @@
 from traders import Trader
 from typing import List
 import asyncio
+import json
+import multiprocessing
 from tracers import LogTracer
 from agents import add_trace_processor
 from market import is_market_open
+from accounts_client import accounts_sessions
+from mcp_fleet import MCPServerFleet
+from scheduler import TraderScheduler
 from dotenv import load_dotenv
 import os
 
@@ -15,40 +20,98 @@ RUN_EVEN_WHEN_MARKET_IS_CLOSED = (
 )
 USE_MANY_MODELS = os.getenv("USE_MANY_MODELS", "false").strip().lower() == "true"
 
-names = ["Warren", "George", "Ray", "Cathie"]
-lastnames = ["Patience", "Bold", "Systematic", "Crypto"]
+# A JSON file listing the traders, e.g. {"traders": [{"name": "Warren", "lastname": "Patience",
+# "model_name": "gpt-4o-mini", "short_model_name": "GPT 4o mini"}, ...]}; without one, the four below run
+TRADERS_CONFIG = os.getenv("TRADERS_CONFIG", "traders.json")
+
+# With more than one worker, the traders are split into shards that run in separate processes
+TRADER_WORKERS = int(os.getenv("TRADER_WORKERS", "1"))
+
+default_names = ["Warren", "George", "Ray", "Cathie"]
+default_lastnames = ["Patience", "Bold", "Systematic", "Crypto"]
 
 if USE_MANY_MODELS:
-    model_names = [
+    default_model_names = [
         "gpt-4.1-mini",
         "deepseek-chat",
         "gemini-2.5-flash-preview-04-17",
         "grok-3-mini-beta",
     ]
-    short_model_names = ["GPT 4.1 Mini", "DeepSeek V3", "Gemini 2.5 Flash", "Grok 3 Mini"]
+    default_short_model_names = ["GPT 4.1 Mini", "DeepSeek V3", "Gemini 2.5 Flash", "Grok 3 Mini"]
 else:
-    model_names = ["gpt-4o-mini"] * 4
-    short_model_names = ["GPT 4o mini"] * 4
+    default_model_names = ["gpt-4o-mini"] * 4
+    default_short_model_names = ["GPT 4o mini"] * 4
+
+
+def load_trader_configs(path: str = TRADERS_CONFIG) -> list[dict]:
+    if not os.path.exists(path):
+        return [
+            {"name": name, "lastname": lastname, "model_name": model_name, "short_model_name": short_model_name}
+            for name, lastname, model_name, short_model_name in zip(
+                default_names, default_lastnames, default_model_names, default_short_model_names
+            )
+        ]
+    with open(path) as f:
+        configs = json.load(f)["traders"]
+    for config in configs:
+        config.setdefault("lastname", "Trader")
+        config.setdefault("model_name", "gpt-4o-mini")
+        config.setdefault("short_model_name", config["model_name"])
+    return configs
+
+
+trader_configs = load_trader_configs()
+names = [config["name"] for config in trader_configs]
+lastnames = [config["lastname"] for config in trader_configs]
+model_names = [config["model_name"] for config in trader_configs]
+short_model_names = [config["short_model_name"] for config in trader_configs]
 
 
-def create_traders() -> List[Trader]:
+def create_traders(fleet: MCPServerFleet | None = None, configs: list[dict] | None = None) -> List[Trader]:
     traders = []
-    for name, lastname, model_name in zip(names, lastnames, model_names):
-        traders.append(Trader(name, lastname, model_name))
+    for config in configs or trader_configs:
+        traders.append(Trader(config["name"], config["lastname"], config["model_name"], fleet))
     return traders
 
 
-async def run_every_n_minutes():
+async def run_every_n_minutes(configs: list[dict] | None = None):
     add_trace_processor(LogTracer())
-    traders = create_traders()
-    while True:
-        if RUN_EVEN_WHEN_MARKET_IS_CLOSED or is_market_open():
-            await asyncio.gather(*[trader.run() for trader in traders])
-        else:
-            print("Market is closed, skipping run")
-        await asyncio.sleep(RUN_EVERY_N_MINUTES * 60)
+    async with accounts_sessions, MCPServerFleet() as fleet:
+        scheduler = TraderScheduler(
+            create_traders(fleet, configs),
+            interval=RUN_EVERY_N_MINUTES * 60,
+            should_run=lambda: RUN_EVEN_WHEN_MARKET_IS_CLOSED or is_market_open(),
+            on_cycle=lambda: print(fleet.report()),
+        )
+        await scheduler.run_forever()
+
+
+def run_shard(configs: list[dict]):
+    asyncio.run(run_every_n_minutes(configs))
+
+
+def run_sharded(workers: int):
+    """
+    Run the traders in worker processes, each with its own scheduler, MCP server fleet and
+    accounts sessions; the shared SQLite database is safe for concurrent writers in WAL mode.
+    Provider limits apply per worker.
+    """
+    shards = [trader_configs[index::workers] for index in range(workers)]
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_shard, args=(shard,), name=f"trader-shard-{index}")
+        for index, shard in enumerate(shards)
+        if shard
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
 
 
 if __name__ == "__main__":
-    print(f"Starting scheduler to run every {RUN_EVERY_N_MINUTES} minutes")
-    asyncio.run(run_every_n_minutes())
+    print(f"Starting scheduler to run {len(trader_configs)} traders every {RUN_EVERY_N_MINUTES} minutes")
+    if TRADER_WORKERS > 1:
+        run_sharded(TRADER_WORKERS)
+    else:
+        asyncio.run(run_every_n_minutes())
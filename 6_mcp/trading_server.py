@@ -0,0 +1,21 @@
+"""
+The accounts, market and push servers' tools and resources in one MCP server process, so a trader
+starts one server (and imports FastMCP and the database module once) instead of three.
+Used in place of the separate servers when MULTIPLEXED_MCP_SERVER is true; see mcp_params.py.
+"""
+
+from mcp.server.fastmcp import FastMCP
+
+import accounts_server
+import market_server
+import push_server
+from notifier import notifier_lifespan
+
+mcp = FastMCP("trading_server", lifespan=notifier_lifespan)
+
+for server in (accounts_server, market_server, push_server):
+    server.register(mcp)
+
+
+if __name__ == "__main__":
+    mcp.run(transport="stdio")